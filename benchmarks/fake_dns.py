@@ -0,0 +1,256 @@
+# fake_dns.py
+"""
+Stand-in DNS hierarchy on loopback for offline resolver benchmarks.
+
+Every server is a tiny authoritative server (UDP + TCP) for the zones it
+hosts. build_hierarchy() generates a root, .com/.net TLDs and a set of
+second-level domains served by a pool of authoritative servers, with
+knobs for per-hop latency, packet loss, glueless delegations and
+truncated UDP replies. Addresses live in 127.53.0.0/16, which Linux
+routes to loopback without any setup.
+"""
+import random
+import struct
+import asyncio
+
+from utils.dns.wire import (
+    parse_message, encode_name, encode_rdata, ParseError,
+    TYPE_A, TYPE_NS, TYPE_CNAME, TYPE_SOA, TYPE_TXT, TYPE_MX,
+)
+
+
+_HEADER = struct.Struct(">HHHHHH")
+_RR = struct.Struct(">HHIH")
+_U16 = struct.Struct(">H")
+
+NOERROR, NXDOMAIN, REFUSED = 0, 3, 5
+
+
+def _name(name: str) -> str:
+    return name.lower().strip(".")
+
+
+def _in(name: str, zone: str) -> bool:
+    return not zone or name == zone or name.endswith("." + zone)
+
+
+def _rr(owner: str, rtype: int, ttl: int, value: str) -> bytes:
+    rdata = encode_rdata(rtype, value)
+    return encode_name(owner) + _RR.pack(rtype, 1, ttl, len(rdata)) + rdata
+
+
+class Zone:
+    """
+    Records of one zone plus its delegations. cuts maps a child zone to
+    [(ns name, glue ip or None)]. truncate makes UDP answers from this
+    zone come back with TC set and no records.
+    """
+
+    def __init__(self, name: str, negative_ttl: int = 300, truncate: bool = False):
+        self.name = _name(name)
+        self.records: dict[tuple[str, int], list[tuple[int, str]]] = {}
+        self.owners: set[str] = set()
+        self.cuts: dict[str, list[tuple[str, str | None]]] = {}
+        self.negative_ttl = negative_ttl
+        self.truncate = truncate
+        self.soa = f"ns.{self.name or 'root'} hostmaster.{self.name or 'root'} 1 7200 900 1209600 {negative_ttl}"
+
+    def add(self, owner: str, rtype: int, ttl: int, value: str):
+        owner = _name(owner)
+        self.records.setdefault((owner, rtype), []).append((ttl, value))
+        # every ancestor inside the zone exists too (empty non-terminals)
+        while _in(owner, self.name) and owner not in self.owners:
+            self.owners.add(owner)
+            if owner == self.name:
+                break
+            owner = owner.partition(".")[2]
+
+    def delegate(self, child: str, nameservers: list):
+        self.cuts[_name(child)] = nameservers
+
+
+class FakeServer:
+    def __init__(self, ip: str, zones: list, latency: float = 0.0, loss: float = 0.0):
+        self.ip = ip
+        self.zones = zones
+        self.latency = latency
+        self.loss = loss
+        self.queries = 0
+        self.truncated = 0
+
+    def answer(self, data: bytes, tcp: bool = False) -> bytes | None:
+        self.queries += 1
+        try:
+            msg = parse_message(data)
+        except ParseError:
+            return None
+        if not msg.questions:
+            return None
+        q = msg.questions[0]
+        qname = _name(q.name)
+        question = encode_name(q.name) + struct.pack(">HH", q.qtype, q.qclass)
+        flags = 0x8000 | (msg.header.flags & 0x0100)
+
+        zone = max((z for z in self.zones if _in(qname, z.name)), key=lambda z: len(z.name), default=None)
+        if zone is None:
+            return _HEADER.pack(msg.header.id, flags | REFUSED, 1, 0, 0, 0) + question
+
+        answer, authority, additional, rcode = [], [], [], NOERROR
+        cut = max((c for c in zone.cuts if _in(qname, c) and c != zone.name), key=len, default=None)
+        if cut is not None:
+            for ns_name, glue in zone.cuts[cut]:
+                authority.append(_rr(cut, TYPE_NS, 3600, ns_name))
+                if glue:
+                    additional.append(_rr(ns_name, TYPE_A, 3600, glue))
+        else:
+            flags |= 0x0400
+            records = zone.records.get((qname, q.qtype))
+            cname = zone.records.get((qname, TYPE_CNAME))
+            if records:
+                answer = [_rr(qname, q.qtype, ttl, value) for ttl, value in records]
+            elif cname:
+                answer = [_rr(qname, TYPE_CNAME, ttl, value) for ttl, value in cname]
+            else:
+                if qname not in zone.owners:
+                    rcode = NXDOMAIN
+                authority = [_rr(zone.name, TYPE_SOA, zone.negative_ttl, zone.soa)]
+            if zone.truncate and not tcp and answer:
+                self.truncated += 1
+                return _HEADER.pack(msg.header.id, flags | 0x0200, 1, 0, 0, 0) + question
+
+        return (_HEADER.pack(msg.header.id, flags | rcode, 1, len(answer), len(authority), len(additional))
+                + question + b"".join(answer + authority + additional))
+
+
+class _UDP(asyncio.DatagramProtocol):
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.server.loss and random.random() < self.server.loss:
+            return
+        reply = self.server.answer(data)
+        if reply is None:
+            return
+        if self.server.latency:
+            asyncio.get_running_loop().call_later(self.server.latency, self.transport.sendto, reply, addr)
+        else:
+            self.transport.sendto(reply, addr)
+
+
+async def _serve_tcp(server: FakeServer, reader, writer):
+    try:
+        while True:
+            length = _U16.unpack(await reader.readexactly(2))[0]
+            reply = server.answer(await reader.readexactly(length), tcp=True)
+            if server.latency:
+                await asyncio.sleep(server.latency)
+            if reply is not None:
+                writer.write(_U16.pack(len(reply)) + reply)
+                await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+class Hierarchy:
+    """A set of FakeServers plus what the benchmark needs to know about them."""
+
+    def __init__(self, servers: list, roots: list, names: list, missing: list):
+        self.servers = servers
+        self.roots = roots          # [(name, ip)] for root hints
+        self.names = names          # (name, type) pairs that resolve
+        self.missing = missing      # names that do not exist
+        self._handles = []
+
+    @property
+    def queries(self) -> int:
+        return sum(s.queries for s in self.servers)
+
+    async def start(self, port: int):
+        loop = asyncio.get_running_loop()
+        for server in self.servers:
+            udp, _ = await loop.create_datagram_endpoint(lambda s=server: _UDP(s), local_addr=(server.ip, port))
+            tcp = await asyncio.start_server(lambda r, w, s=server: _serve_tcp(s, r, w), server.ip, port)
+            self._handles += [udp, tcp]
+
+    async def stop(self):
+        await asyncio.sleep(0.05)  # let TCP handlers see their clients hang up
+        for handle in self._handles:
+            handle.close()
+        for handle in self._handles:
+            if isinstance(handle, asyncio.AbstractServer):
+                await handle.wait_closed()
+        self._handles = []
+
+
+def build_hierarchy(domains: int = 200, hosts: int = 10, auth_servers: int = 4, glueless: float = 0.2,
+                    truncate: float = 0.05, latency: float = 0.002, loss: float = 0.0, ttl: int = 300,
+                    seed: int = 1) -> Hierarchy:
+    """
+    root (2 servers) -> com, net (2 servers each) -> d<i>.com / d<i>.net on
+    auth_servers shared authoritative servers, each domain on two of them.
+
+    A glueless fraction of domains is delegated to nameservers under
+    dnshost.net with no glue, so resolving them needs a nested lookup. A
+    truncate fraction only answers over TCP. Each domain has hosts A
+    records h<k>, a www CNAME to h0, MX and TXT at the apex.
+    """
+    rng = random.Random(seed)
+    root_ips = ["127.53.0.1", "127.53.0.2"]
+    tld_ips = ["127.53.1.1", "127.53.1.2"]
+    auth_ips = [f"127.53.2.{i + 1}" for i in range(auth_servers)]
+
+    root = Zone("")
+    tlds = {tld: Zone(tld) for tld in ("com", "net")}
+    for tld in tlds:
+        root.delegate(tld, [(f"{c}.gtld-servers.net", ip) for c, ip in zip("ab", tld_ips)])
+
+    auth_zones = {ip: [] for ip in auth_ips}
+
+    # nameserver host for glueless delegations, itself delegated with glue
+    host_zone = Zone("dnshost.net")
+    hosting = [auth_ips[0], auth_ips[-1]]
+    tlds["net"].delegate("dnshost.net", [(f"{c}.dnshost.net", ip) for c, ip in zip("ab", hosting)])
+    for c, ip in zip("ab", hosting):
+        host_zone.add(f"{c}.dnshost.net", TYPE_A, 3600, ip)
+    for i, ip in enumerate(auth_ips):
+        host_zone.add(f"ns{i}.dnshost.net", TYPE_A, 3600, ip)
+    for ip in hosting:
+        auth_zones[ip].append(host_zone)
+
+    names, missing = [], []
+    for d in range(domains):
+        tld = "com" if d % 2 == 0 else "net"
+        domain = f"d{d}.{tld}"
+        zone = Zone(domain, truncate=rng.random() < truncate)
+        pair = [auth_ips[d % auth_servers], auth_ips[(d + 1) % auth_servers]]
+        if rng.random() < glueless:
+            ns = [(f"ns{auth_ips.index(ip)}.dnshost.net", None) for ip in pair]
+        else:
+            ns = [(f"ns{i}.{domain}", ip) for i, ip in enumerate(pair)]
+            for i, ip in enumerate(pair):
+                zone.add(f"ns{i}.{domain}", TYPE_A, 3600, ip)
+        tlds[tld].delegate(domain, ns)
+
+        for k in range(hosts):
+            zone.add(f"h{k}.{domain}", TYPE_A, ttl, f"10.{d // 250}.{d % 250}.{k + 1}")
+            names.append((f"h{k}.{domain}", "A"))
+        zone.add(f"www.{domain}", TYPE_CNAME, ttl, f"h0.{domain}")
+        zone.add(domain, TYPE_MX, ttl, f"10 mail.{domain}")
+        zone.add(domain, TYPE_TXT, ttl, "v=spf1 -all")
+        names += [(f"www.{domain}", "A"), (domain, "MX"), (domain, "TXT")]
+        missing.append(f"nope{d}.{domain}")
+        for ip in pair:
+            auth_zones[ip].append(zone)
+
+    servers = [FakeServer(ip, [root], latency, loss) for ip in root_ips]
+    servers += [FakeServer(ip, list(tlds.values()), latency, loss) for ip in tld_ips]
+    servers += [FakeServer(ip, auth_zones[ip], latency, loss) for ip in auth_ips]
+    roots = [(f"{c}.root-servers.test", ip) for c, ip in zip("ab", root_ips)]
+    return Hierarchy(servers, roots, names, missing)
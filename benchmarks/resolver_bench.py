@@ -0,0 +1,214 @@
+# resolver_bench.py
+"""
+End-to-end benchmark of utils/dns against the fake hierarchy in fake_dns.py.
+
+    python -m benchmarks.resolver_bench
+    python -m benchmarks.resolver_bench --latency 0.01 --loss 0.01 --json out.json
+    python -m benchmarks.resolver_bench --compare out.json   # exit 1 on regression
+
+Runs three workloads against a private LMDB cache in a temp directory:
+cold (every name once, empty caches), warm (the same names again) and
+mixed (Zipf-distributed repeats plus new and nonexistent names). Reports
+QPS, p50/p95/p99 latency, upstream queries per resolution and hit ratios.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+# must be set before utils.dns.cache opens its environment
+_TMP = tempfile.mkdtemp(prefix="dns_bench_")
+os.environ["DNS_CACHE_DIR"] = _TMP
+
+from utils.dns import main as resolver  # noqa: E402
+from utils.dns import cache  # noqa: E402
+from utils.dns.srtt import ServerSelector  # noqa: E402
+from utils.dns.querylog import QUERY_LOG  # noqa: E402
+from utils.dns.transport import get_multiplexer, get_tcp_pool  # noqa: E402
+from benchmarks.fake_dns import build_hierarchy  # noqa: E402
+
+
+# metric -> True if higher is better; used by --compare
+METRICS = {"qps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "upstream_per_query": False}
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def point_resolver_at(hierarchy, port: int):
+    hints = os.path.join(_TMP, "root.hints")
+    with open(hints, "w") as f:
+        for name, ip in hierarchy.roots:
+            f.write(f"{name}.      3600000      A     {ip}\n")
+    resolver.ROOT_HINTS = hints
+    resolver.ROOT_STATE_FILE = Path(_TMP) / "dns_roots.json"
+    resolver.UPSTREAM_PORT = port
+    QUERY_LOG.path = os.path.join(_TMP, "dns_queries.jsonl")
+
+
+def reset_caches():
+    cache.clear_all()
+    resolver.DELEGATIONS.clear()
+    resolver.SERVERS = ServerSelector()
+
+
+async def run_workload(label: str, queries: list, hierarchy, concurrency: int) -> dict:
+    latencies, from_cache, failures = [], 0, 0
+    gate = asyncio.Semaphore(concurrency)
+    upstream_before = hierarchy.queries
+    stats_before = dict(cache.STATS)
+
+    async def one(name, rtype):
+        nonlocal from_cache, failures
+        async with gate:
+            start = time.perf_counter()
+            result, cached = await resolver.lookup(name, rtype)
+            latencies.append(time.perf_counter() - start)
+            from_cache += cached
+            failures += result is None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(name, rtype) for name, rtype in queries))
+    elapsed = time.perf_counter() - start
+
+    stats = {k: cache.STATS[k] - stats_before[k] for k in stats_before}
+    l1_total = stats["l1_hits"] + stats["l1_misses"]
+    lmdb_total = stats["lmdb_hits"] + stats["lmdb_misses"]
+    latencies.sort()
+    return {
+        "workload": label,
+        "queries": len(queries),
+        "qps": len(queries) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "upstream_per_query": (hierarchy.queries - upstream_before) / len(queries),
+        "answer_hit_ratio": from_cache / len(queries),
+        "l1_hit_ratio": stats["l1_hits"] / l1_total if l1_total else 0.0,
+        "lmdb_hit_ratio": stats["lmdb_hits"] / lmdb_total if lmdb_total else 0.0,
+        "failures": failures,
+    }
+
+
+def mixed_queries(hierarchy, count: int, known: list, rng: random.Random) -> list:
+    """~80% Zipf-weighted repeats of known names, ~15% new names, ~5% nonexistent ones."""
+    weights = [1 / (rank + 1) for rank in range(len(known))]
+    fresh = [q for q in hierarchy.names if q not in set(known)]
+    queries = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.8 or not fresh:
+            queries.append(rng.choices(known, weights)[0])
+        elif roll < 0.95:
+            queries.append(fresh.pop(rng.randrange(len(fresh))))
+        else:
+            queries.append((rng.choice(hierarchy.missing), "A"))
+    return queries
+
+
+async def run(args) -> list:
+    rng = random.Random(args.seed)
+    hierarchy = build_hierarchy(domains=args.domains, hosts=args.hosts, glueless=args.glueless,
+                                truncate=args.truncate, latency=args.latency, loss=args.loss, seed=args.seed)
+    await hierarchy.start(args.port)
+    point_resolver_at(hierarchy, args.port)
+    try:
+        names = list(hierarchy.names)
+        rng.shuffle(names)
+        known = names[:args.queries]
+
+        results = []
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            reset_caches()
+            results.append(await run_workload("cold", known, hierarchy, args.concurrency))
+            results.append(await run_workload("warm", known, hierarchy, args.concurrency))
+            results.append(await run_workload("mixed", mixed_queries(hierarchy, args.queries, known, rng),
+                                              hierarchy, args.concurrency))
+        return results
+    finally:
+        get_tcp_pool().close()
+        get_multiplexer().close()
+        await hierarchy.stop()
+
+
+def print_table(results: list):
+    columns = [("workload", "{:<8}"), ("queries", "{:>7}"), ("qps", "{:>9.0f}"), ("p50_ms", "{:>8.2f}"),
+               ("p95_ms", "{:>8.2f}"), ("p99_ms", "{:>8.2f}"), ("upstream_per_query", "{:>9.2f}"),
+               ("answer_hit_ratio", "{:>8.1%}"), ("l1_hit_ratio", "{:>8.1%}"), ("lmdb_hit_ratio", "{:>8.1%}"),
+               ("failures", "{:>5}")]
+    titles = ["workload", "queries", "qps", "p50 ms", "p95 ms", "p99 ms", "upstr/q", "hits", "L1", "LMDB", "fail"]
+    widths = [len(fmt.format(0 if name != "workload" else "")) for name, fmt in columns]
+    print("  ".join(title.rjust(width) if i else title.ljust(width) for i, (title, width) in enumerate(zip(titles, widths))))
+    for row in results:
+        print("  ".join(fmt.format(row[name]) for name, fmt in columns))
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Human-readable regressions of results against a saved --json run."""
+    with open(baseline_path) as f:
+        saved = json.load(f)
+    baseline = {row["workload"]: row for row in saved["results"]}
+    regressions = []
+    for row in results:
+        base = baseline.get(row["workload"])
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base[metric], row[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{row['workload']} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    return regressions
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Benchmark the DNS resolver against a local fake hierarchy.")
+    parser.add_argument("--port", type=int, default=5300, help="port of the fake servers (default 5300)")
+    parser.add_argument("--domains", type=int, default=200)
+    parser.add_argument("--hosts", type=int, default=10, help="A records per domain")
+    parser.add_argument("--queries", type=int, default=1000, help="names per workload")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds added to every upstream reply")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of UDP queries dropped")
+    parser.add_argument("--glueless", type=float, default=0.2, help="fraction of domains delegated without glue")
+    parser.add_argument("--truncate", type=float, default=0.05, help="fraction of domains answering TC over UDP")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--compare", help="baseline --json file; exit 1 if a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default 0.25)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            saved_args = json.load(f).get("args", {})
+        shaping = ("domains", "hosts", "queries", "concurrency", "latency", "loss", "glueless", "truncate", "seed")
+        differing = [k for k in shaping if k in saved_args and saved_args[k] != getattr(args, k)]
+        if differing:
+            print(f"[-] baseline was run with different {', '.join(differing)}; numbers are not comparable")
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"[-] regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("[+] no regressions against", args.compare)
+
+
+if __name__ == "__main__":
+    cli()
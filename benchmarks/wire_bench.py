@@ -0,0 +1,185 @@
+# wire_bench.py
+"""
+Microbenchmarks for the DNS wire hot path: building queries and replies,
+parsing every packet in wire_corpus, and pulling referrals and answers
+out of parsed messages.
+
+    python -m benchmarks.wire_bench
+    python -m benchmarks.wire_bench --json base.json
+    python -m benchmarks.wire_bench --compare base.json   # exit 1 on regression
+
+ns/op is the best of several timed rounds. alloc B/op is the peak memory
+traced by tracemalloc while running one op. "norm" divides ns/op by a
+fixed pure-Python calibration loop timed in the same run, so baselines
+saved on one machine stay meaningful on another; --compare uses it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+os.environ.setdefault("DNS_CACHE_DIR", tempfile.mkdtemp(prefix="dns_wire_bench_"))
+
+from utils.dns import main as resolver  # noqa: E402
+from utils.dns.wire import parse_message, build_reply, encode_name, ParseError, TYPE_A, TYPE_CNAME  # noqa: E402
+from utils.dns.transport import read_question  # noqa: E402
+from benchmarks.wire_corpus import CORPUS, MALFORMED  # noqa: E402
+
+
+def calibration():
+    # stand-in for "how fast is this interpreter on this box", similar mix of ops to the parser
+    total = 0
+    data = b"\x07example\x03com\x00" * 4
+    for i in range(200):
+        total += data[i % len(data)] + len(str(i))
+    return total
+
+
+def _reject(packet):
+    def op():
+        try:
+            parse_message(packet)
+        except ParseError:
+            pass
+        else:
+            raise AssertionError("malformed packet was accepted")
+    return op
+
+
+def build_cases() -> dict:
+    parsed = {name: parse_message(packet) for name, packet in CORPUS.items()}
+    query = parsed["query"]
+    answers = [("www.example.com", TYPE_CNAME, 300, "cdn.example.net")] + \
+              [("cdn.example.net", TYPE_A, 20, f"23.0.0.{i}") for i in range(8)]
+
+    cases = {
+        "encode/make_header": lambda: resolver.make_header(),
+        "encode/qname_creator": lambda: resolver.qname_creator("www.example.com"),
+        "encode/query_edns": lambda: resolver.query("www.example.com", TYPE_A, use_edns=True),
+        "encode/encode_name": lambda: encode_name("www.example.com"),
+        "encode/build_reply": lambda: build_reply(query, 0, answers, max_size=1232, edns=True),
+        "decode/read_question": lambda: read_question(CORPUS["cdn_cname_chain"]),
+    }
+    for name, packet in CORPUS.items():
+        cases[f"decode/{name}"] = lambda packet=packet: parse_message(packet)
+    for name, packet in MALFORMED.items():
+        cases[f"reject/{name}"] = _reject(packet)
+    for name in ("root_referral_com", "tld_referral", "glueless_referral"):
+        cases[f"extract/referral_{name}"] = lambda msg=parsed[name]: resolver.read_referral(msg)
+    cases["extract/answer_cname_chain"] = lambda: resolver.read_answer(parsed["cdn_cname_chain"], "www.example.com", TYPE_A)
+    return cases
+
+
+def time_op(op, min_time: float, rounds: int) -> float:
+    """Best ns/op over rounds, each round looping long enough to last min_time."""
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            op()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for _ in range(rounds - 1):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            op()
+        best = min(best, (time.perf_counter_ns() - start) / loops)
+    return best
+
+
+def alloc_bytes(op) -> int:
+    op()  # warm caches and interned strings first
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        op()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def run(min_time: float, rounds: int, only: str | None) -> dict:
+    calibration_ns = time_op(calibration, min_time, rounds)
+    results = {}
+    for name, op in build_cases().items():
+        if only and only not in name:
+            continue
+        ns = time_op(op, min_time, rounds)
+        results[name] = {"ns_per_op": ns, "norm": ns / calibration_ns, "alloc_bytes": alloc_bytes(op)}
+    return {"calibration_ns": calibration_ns, "results": results}
+
+
+def _regressed(row: dict, base: dict, tolerance: float, min_delta_ns: float) -> bool:
+    # tiny ops jitter by a few hundred ns from scheduling alone
+    return row["norm"] / base["norm"] - 1 > tolerance and row["ns_per_op"] - base["ns_per_op"] > min_delta_ns
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ns: float, min_time: float, rounds: int) -> list:
+    """
+    Cases slower than the baseline by more than tolerance (normalised).
+    Suspects are timed again twice as long and only count if they stay slow,
+    so one noisy round on a shared box does not fail the run.
+    """
+    cases = build_cases()
+    regressions = []
+    for name, row in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not _regressed(row, base, tolerance, min_delta_ns):
+            continue
+        for _ in range(2):
+            calibration_ns = time_op(calibration, min_time * 2, rounds)
+            ns = time_op(cases[name], min_time * 2, rounds)
+            if ns < row["ns_per_op"]:
+                row = {**row, "ns_per_op": ns, "norm": ns / calibration_ns}
+            if not _regressed(row, base, tolerance, min_delta_ns):
+                break
+        else:
+            change = row["norm"] / base["norm"] - 1
+            regressions.append(f"{name}: {base['ns_per_op']:.0f} -> {row['ns_per_op']:.0f} ns/op ({change:+.0%} normalised)")
+    return regressions
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for DNS wire encoding and decoding.")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timed round (default 0.05)")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--only", help="run only cases whose name contains this")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline --json file; exit 1 if a case got slower")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed normalised slowdown (default 0.25)")
+    parser.add_argument("--min-delta", type=float, default=1000, help="ignore slowdowns under this many ns/op (default 1000)")
+    args = parser.parse_args()
+
+    # read_answer() and friends log as they go, keep that out of the timings
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        current = run(args.min_time, args.rounds, args.only)
+    print(f"calibration: {current['calibration_ns']:.0f} ns")
+    print(f"{'case':<40} {'ns/op':>10} {'norm':>7} {'alloc B/op':>11}")
+    for name, row in current["results"].items():
+        print(f"{name:<40} {row['ns_per_op']:>10.0f} {row['norm']:>7.3f} {row['alloc_bytes']:>11}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            regressions = compare(current, baseline, args.tolerance, args.min_delta, args.min_time, args.rounds)
+        for line in regressions:
+            print(f"[-] regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("[+] no regressions against", args.compare)
+
+
+if __name__ == "__main__":
+    cli()
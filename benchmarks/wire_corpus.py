@@ -0,0 +1,202 @@
+# wire_corpus.py
+"""
+Packet corpus for the wire microbenchmarks.
+
+The packets are built byte for byte the way real servers lay them out
+(name compression against earlier owners, glue in the additional
+section, EDNS OPT last), modelled on captures of a .com referral from a
+root server, a gTLD referral, CDN CNAME chains and so on. Building them
+here instead of shipping pcaps keeps the corpus deterministic and
+reviewable. MALFORMED holds packets the parser has to reject.
+"""
+import socket
+import struct
+
+from utils.dns.wire import TYPE_A, TYPE_AAAA, TYPE_NS, TYPE_CNAME, TYPE_SOA, TYPE_MX, TYPE_TXT, TYPE_OPT
+
+
+class PacketBuilder:
+    """Minimal DNS message writer with RFC 1035 name compression."""
+
+    def __init__(self, msg_id: int = 0x1234, flags: int = 0x8000):
+        self.msg_id = msg_id
+        self.flags = flags
+        self.buf = bytearray(12)
+        self.names: dict[str, int] = {}
+        self.counts = [0, 0, 0, 0]
+
+    def name(self, name: str) -> bytes:
+        labels = [label for label in name.strip(".").split(".") if label]
+        out = bytearray()
+        for i in range(len(labels)):
+            suffix = ".".join(labels[i:]).lower()
+            pointer = self.names.get(suffix)
+            if pointer is not None:
+                return bytes(out + struct.pack(">H", 0xC000 | pointer))
+            offset = len(self.buf) + len(out)
+            if offset < 0x3FFF:
+                self.names[suffix] = offset
+            out += bytes([len(labels[i])]) + labels[i].encode()
+        return bytes(out + b"\x00")
+
+    def question(self, name: str, qtype: int):
+        self.buf += self.name(name) + struct.pack(">HH", qtype, 1)
+        self.counts[0] += 1
+        return self
+
+    def record(self, section: int, name: str, rtype: int, ttl: int, value):
+        self.buf += self.name(name)
+        header_at = len(self.buf)
+        self.buf += struct.pack(">HHIH", rtype, 1, ttl, 0)
+        start = len(self.buf)
+        if rtype == TYPE_A:
+            self.buf += socket.inet_aton(value)
+        elif rtype == TYPE_AAAA:
+            self.buf += socket.inet_pton(socket.AF_INET6, value)
+        elif rtype in (TYPE_NS, TYPE_CNAME):
+            self.buf += self.name(value)
+        elif rtype == TYPE_MX:
+            self.buf += struct.pack(">H", value[0])
+            self.buf += self.name(value[1])
+        elif rtype == TYPE_TXT:
+            for chunk in value:
+                self.buf += bytes([len(chunk)]) + chunk.encode()
+        elif rtype == TYPE_SOA:
+            self.buf += self.name(value[0])
+            self.buf += self.name(value[1])
+            self.buf += struct.pack(">IIIII", *value[2:])
+        struct.pack_into(">H", self.buf, header_at + 8, len(self.buf) - start)
+        self.counts[section] += 1
+        return self
+
+    def opt(self, size: int = 1232):
+        self.buf += b"\x00" + struct.pack(">HHIH", TYPE_OPT, size, 0, 0)
+        self.counts[3] += 1
+        return self
+
+    def build(self) -> bytes:
+        struct.pack_into(">HHHHHH", self.buf, 0, self.msg_id, self.flags, *self.counts)
+        return bytes(self.buf)
+
+
+ANSWER, AUTHORITY, ADDITIONAL = 1, 2, 3
+GTLD = "abcdefghijklm"
+
+
+def root_referral_com() -> bytes:
+    """Root server's referral for www.example.com: 13 gTLD NS, A + AAAA glue for each."""
+    b = PacketBuilder().question("www.example.com", TYPE_A)
+    for c in GTLD:
+        b.record(AUTHORITY, "com", TYPE_NS, 172800, f"{c}.gtld-servers.net")
+    for i, c in enumerate(GTLD):
+        b.record(ADDITIONAL, f"{c}.gtld-servers.net", TYPE_A, 172800, f"192.{i}.6.30")
+        b.record(ADDITIONAL, f"{c}.gtld-servers.net", TYPE_AAAA, 172800, f"2001:503:{i:x}::2:30")
+    return b.opt().build()
+
+
+def tld_referral() -> bytes:
+    """gTLD referral to a domain with four in-bailiwick nameservers and glue."""
+    b = PacketBuilder().question("www.example.com", TYPE_A)
+    for i in range(1, 5):
+        b.record(AUTHORITY, "example.com", TYPE_NS, 172800, f"ns{i}.example.com")
+    for i in range(1, 5):
+        b.record(ADDITIONAL, f"ns{i}.example.com", TYPE_A, 172800, f"199.43.{i}.53")
+        b.record(ADDITIONAL, f"ns{i}.example.com", TYPE_AAAA, 172800, f"2001:500:8f::{i}")
+    return b.opt().build()
+
+
+def glueless_referral() -> bytes:
+    """Referral to out-of-bailiwick nameservers, no glue at all."""
+    b = PacketBuilder().question("shop.example.org", TYPE_A)
+    for i in range(1, 5):
+        b.record(AUTHORITY, "example.org", TYPE_NS, 86400, f"ns-{i * 311}.awsdns-{i * 7}.co.uk")
+    return b.opt().build()
+
+
+def cdn_cname_chain() -> bytes:
+    """Authoritative answer with a three link CNAME chain ending in eight A records."""
+    b = PacketBuilder(flags=0x8400).question("www.example.com", TYPE_A)
+    b.record(ANSWER, "www.example.com", TYPE_CNAME, 300, "www.example.com.cdn.example.net")
+    b.record(ANSWER, "www.example.com.cdn.example.net", TYPE_CNAME, 60, "e1234.a.cdn.example.net")
+    b.record(ANSWER, "e1234.a.cdn.example.net", TYPE_CNAME, 20, "e1234.a.edge.example.net")
+    for i in range(8):
+        b.record(ANSWER, "e1234.a.edge.example.net", TYPE_A, 20, f"23.{i}.0.{10 + i}")
+    return b.opt().build()
+
+
+def mx_answer() -> bytes:
+    b = PacketBuilder(flags=0x8400).question("example.com", TYPE_MX)
+    for pref, host in ((1, "aspmx.l.google.com"), (5, "alt1.aspmx.l.google.com"), (5, "alt2.aspmx.l.google.com"),
+                       (10, "alt3.aspmx.l.google.com"), (10, "alt4.aspmx.l.google.com")):
+        b.record(ANSWER, "example.com", TYPE_MX, 3600, (pref, host))
+    return b.opt().build()
+
+
+def large_txt() -> bytes:
+    """SPF/verification style TXT set, several strings per record."""
+    b = PacketBuilder(flags=0x8400).question("example.com", TYPE_TXT)
+    for i in range(6):
+        b.record(ANSWER, "example.com", TYPE_TXT, 300, [f"v=spf1 include:_spf{i}.example.net ~all", "x" * 200])
+    return b.opt().build()
+
+
+def nxdomain_soa() -> bytes:
+    b = PacketBuilder(flags=0x8403).question("nope.example.com", TYPE_A)
+    b.record(AUTHORITY, "example.com", TYPE_SOA, 3600,
+             ("ns1.example.com", "hostmaster.example.com", 2024010101, 7200, 900, 1209600, 300))
+    return b.opt().build()
+
+
+def truncated_reply() -> bytes:
+    """TC set, counts promise a big answer but the datagram stops partway through it."""
+    full = cdn_cname_chain()
+    b = bytearray(full[:180])
+    struct.pack_into(">H", b, 2, 0x8600)
+    return bytes(b)
+
+
+def query_packet() -> bytes:
+    return PacketBuilder(flags=0x0100).question("www.example.com", TYPE_A).opt().build()
+
+
+def _malformed() -> dict:
+    base = bytearray(PacketBuilder(flags=0x8400).question("example.com", TYPE_A)
+                     .record(ANSWER, "example.com", TYPE_A, 300, "93.184.216.34").build())
+    answer_name = 12 + len(b"\x07example\x03com\x00") + 4
+
+    loop = bytearray(base)
+    loop[answer_name:answer_name + 2] = struct.pack(">H", 0xC000 | answer_name)  # points at itself
+
+    forward = bytearray(base)
+    forward[answer_name:answer_name + 2] = struct.pack(">H", 0xC000 | (len(base) - 2))  # points ahead
+
+    outside = bytearray(base)
+    outside[answer_name:answer_name + 2] = struct.pack(">H", 0xFFFF)  # past the end
+
+    short_rdata = bytearray(base[:-2])  # rdlength says 4, only 2 bytes follow
+
+    long_name = bytearray(12) + (b"\x3f" + b"a" * 63) * 5 + b"\x00" + struct.pack(">HH", 1, 1)
+    struct.pack_into(">HHHHHH", long_name, 0, 1, 0x8000, 1, 0, 0, 0)
+
+    return {
+        "pointer_loop": bytes(loop),
+        "forward_pointer": bytes(forward),
+        "pointer_out_of_range": bytes(outside),
+        "short_rdata": bytes(short_rdata),
+        "name_too_long": bytes(long_name),
+        "short_header": b"\x12\x34\x81",
+    }
+
+
+CORPUS = {
+    "root_referral_com": root_referral_com(),
+    "tld_referral": tld_referral(),
+    "glueless_referral": glueless_referral(),
+    "cdn_cname_chain": cdn_cname_chain(),
+    "mx_answer": mx_answer(),
+    "large_txt": large_txt(),
+    "nxdomain_soa": nxdomain_soa(),
+    "truncated_reply": truncated_reply(),
+    "query": query_packet(),
+}
+MALFORMED = _malformed()
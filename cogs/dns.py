@@ -1,30 +1,225 @@
+import io
+import re
+import asyncio
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from utils.dns.main import resolver  # Import from your custom dns module
+from utils.dns.main import resolve, resolve_many, bootstrap, stats, SUPPORTED_TYPES, BATCH_CONCURRENCY  # Import from your custom dns module
+from utils.dns.cache import purge_expired, SWEEP_INTERVAL, SWEEP_BATCH
+from utils.dns.querylog import QUERY_LOG, FLUSH_INTERVAL
+from utils.dns.analytics import ANALYTICS, WINDOWS
 from utils.rate_limit import handle_rate_limit
+from utils.admission import ADMISSION, Overloaded
+
+BATCH_MAX_NAMES = 100          # distinct (name, type) pairs per /dnsbatch
+BATCH_MAX_CONCURRENCY = 32     # upper bound for the user supplied concurrency
+BATCH_MAX_FILE_BYTES = 64 * 1024
+MESSAGE_LIMIT = 2000
+
+
+def parse_batch(text: str, default_type: str = "A"):
+    """
+    Turn free-form input into (name, type) pairs. Entries are split on commas,
+    semicolons, whitespace and newlines; a record type token applies to the
+    name right before it ("example.com MX, example.org" -> MX, then A).
+    """
+    pairs = []
+    for token in re.split(r"[\s,;]+", text):
+        if not token:
+            continue
+        if token.upper() in SUPPORTED_TYPES and pairs and not pairs[-1][2]:
+            pairs[-1] = (pairs[-1][0], token.upper(), True)
+        else:
+            pairs.append((token, default_type, False))
+    return [(name, rtype) for name, rtype, _ in pairs]
+
+
+def format_batch(results) -> str:
+    rows = []
+    for name, rtype, result in results:
+        if isinstance(result, Exception):
+            status, values = "ERROR", str(result) or type(result).__name__
+        elif result is None:
+            status, values = "SERVFAIL", "-"
+        elif not result:
+            status, values = getattr(result, "rcode", "NXDOMAIN"), "-"
+        else:
+            status, values = "NOERROR", ", ".join(str(value) for value, _ in result)
+        rows.append((name, rtype, status, values))
+
+    name_width = max([len("NAME")] + [len(r[0]) for r in rows])
+    lines = [f"{'NAME':<{name_width}}  {'TYPE':<5}  {'STATUS':<8}  VALUES"]
+    lines += [f"{name:<{name_width}}  {rtype:<5}  {status:<8}  {values}" for name, rtype, status, values in rows]
+    return "\n".join(lines)
+
+
+def format_metrics(snapshot: dict) -> str:
+    lines = [f"{'STAGE':<8} {'COUNT':>7} {'P50 MS':>8} {'P95 MS':>8} {'P99 MS':>8} {'MAX MS':>8}"]
+    for stage, s in [("resolve", snapshot["resolve"])] + list(snapshot["stages"].items()):
+        lines.append(f"{stage:<8} {s['count']:>7} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+
+    up = snapshot["upstream"]
+    lines += ["", f"upstream: {up['queries']} queries, {up['retries']} retries, {up['timeouts']} timeouts, "
+                  f"{up['tcp']} tcp ({up['tcp_errors']} failed), {up['bytes_sent']} B out / {up['bytes_received']} B in"]
+
+    c = snapshot["cache"]
+    l1 = c["l1_hits"] + c["l1_misses"]
+    lmdb = c["lmdb_hits"] + c["lmdb_misses"]
+    lines.append(f"cache: L1 {c['l1_hits']}/{l1} hits ({c['l1_entries']} entries), LMDB {c['lmdb_hits']}/{lmdb} hits")
+    co = snapshot["coalescing"]
+    lines.append(f"coalesced: {co['waiters']} waiters on {co['flights']} lookups, {co['in_flight']} in flight")
+
+    worst = sorted(snapshot["servers"].items(), key=lambda item: -item[1]["timeouts"])[:3]
+    if worst and worst[0][1]["timeouts"]:
+        lines.append("most timeouts: " + ", ".join(f"{ip} ({s['timeouts']}/{s['queries']})" for ip, s in worst if s["timeouts"]))
+    return "\n".join(lines)
+
+
+def format_stats(summary: dict) -> str:
+    rcodes = ", ".join(f"{rcode} {count}" for rcode, count in summary["rcodes"].items() if count)
+    latency = summary["latency_ms"]
+    lines = [
+        f"last {summary['window']}: {summary['queries']} queries ({summary['qps']:.2f}/s), "
+        f"cache hits {summary['cache_hit_ratio']:.0%}",
+        f"rcodes: {rcodes or '-'}",
+        f"latency ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f}",
+    ]
+    if summary["top_domains"]:
+        lines += ["", "top domains:"]
+        lines += [f"{count:>6}  {domain}" for domain, count in summary["top_domains"]]
+    return "\n".join(lines)
+
 
 class Dns(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.sweep_cache.start()
+        self.flush_query_log.start()
+
+    async def cog_load(self):
+        # Root hints come from disk; the root RTT probe runs in the background
+        bootstrap()
+
+    def cog_unload(self):
+        self.sweep_cache.cancel()
+        self.flush_query_log.cancel()
+        QUERY_LOG.flush()
+
+    @tasks.loop(seconds=SWEEP_INTERVAL)
+    async def sweep_cache(self):
+        # Drop expired DNS sets in bounded batches, yielding between them,
+        # so lookups never pay for cache maintenance
+        try:
+            while purge_expired(limit=SWEEP_BATCH) >= SWEEP_BATCH:
+                await asyncio.sleep(0)
+        except Exception as e:
+            # a failed sweep must not stop the loop, the next tick tries again
+            print(f"[-] dns cache sweep failed: {e}")
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_query_log(self):
+        # Batched append of queued /dns log entries, off the event loop
+        await asyncio.to_thread(QUERY_LOG.flush)
 
     @commands.hybrid_command(name='dns', description="custom dns resolver")
-    async def resolve_dns(self, ctx, *, url: str):
-        """Checks if a website is up or down."""
+    async def resolve_dns(self, ctx, url: str, record_type: str = "A"):
+        """Resolves a domain with the custom resolver, following CNAMEs (A, AAAA, CNAME, MX, NS, TXT, SOA)."""
         if not await handle_rate_limit(ctx):
             return
 
         # if not url.startswith(('http://', 'https://')):
         #     url = 'https://' + url
 
-        await ctx.send(f"Resolving '{url}'...")
-        print(f"-> Received /dns request for: {url}")
+        record_type = record_type.upper()
+        if record_type not in SUPPORTED_TYPES:
+            await ctx.send(f"Unsupported record type. Use one of: {', '.join(SUPPORTED_TYPES)}")
+            return
+
+        await ctx.send(f"Resolving '{url}' ({record_type})...")
+        print(f"-> Received /dns request for: {url} {record_type}")
+
+        try:
+            async with ADMISSION.admit("dns"):
+                data = await resolve(url, record_type)
+            values = list(map(lambda x: x[0], data or []))
+            print(values, record_type)
+            if record_type == "A":
+                await ctx.send(f"ips: {values}")
+            else:
+                await ctx.send(f"{record_type} records: {values}")
+        except Overloaded as e:
+            print(f"[-] /dns rejected: {e}")
+            await ctx.send("⏳ Too many lookups right now, please try again in a minute.")
+        except Exception as e:
+            print(e, "exception")
+            await ctx.send(f"❌ somthing went wrong")
+
+    @commands.hybrid_command(name='dnsmetrics', description="resolver latency and cache metrics")
+    async def dns_metrics(self, ctx):
+        """Per-stage resolver latency, upstream counters and cache hit rates since the bot started."""
+        if not await handle_rate_limit(ctx):
+            return
+        await ctx.send(f"```\n{format_metrics(stats())}\n```")
+
+    @commands.hybrid_command(name='dnsstats', description="dns query statistics")
+    async def dns_stats(self, ctx, window: str = "15m"):
+        """Query volume, rcodes, cache hit ratio, latency percentiles and top domains (1m, 15m or 1h)."""
+        if not await handle_rate_limit(ctx):
+            return
+        if window not in WINDOWS:
+            await ctx.send(f"Unknown window. Use one of: {', '.join(WINDOWS)}")
+            return
+        await ctx.send(f"```\n{format_stats(ANALYTICS.summary(window))}\n```")
+
+    @commands.hybrid_command(name='dnsbatch', description="resolve many domains at once")
+    async def resolve_dns_batch(self, ctx, names: str = "", record_type: str = "A",
+                                attachment: discord.Attachment = None, concurrency: int = BATCH_CONCURRENCY):
+        """Resolves a list of domains (or an attached .txt file) concurrently, e.g. `example.com MX, example.org`."""
+        if not await handle_rate_limit(ctx):
+            return
+
+        record_type = record_type.upper()
+        if record_type not in SUPPORTED_TYPES:
+            await ctx.send(f"Unsupported record type. Use one of: {', '.join(SUPPORTED_TYPES)}")
+            return
+
+        # prefix commands can attach the file to the message instead of the option
+        if attachment is None and ctx.message is not None and ctx.message.attachments:
+            attachment = ctx.message.attachments[0]
+
+        text = names
+        if attachment is not None:
+            if attachment.size > BATCH_MAX_FILE_BYTES:
+                await ctx.send(f"Attachment too large (max {BATCH_MAX_FILE_BYTES // 1024} KB).")
+                return
+            text += "\n" + (await attachment.read()).decode("utf-8", "replace")
+
+        queries = parse_batch(text, record_type)
+        if not queries:
+            await ctx.send("Give me some domains, e.g. `/dnsbatch example.com MX, example.org`.")
+            return
+
+        unique = {(name.lower().strip("."), rtype) for name, rtype in queries}
+        if len(unique) > BATCH_MAX_NAMES:
+            await ctx.send(f"Too many names ({len(unique)}), the limit is {BATCH_MAX_NAMES}.")
+            return
+
+        concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+        print(f"-> Received /dnsbatch request for {len(unique)} names (concurrency {concurrency})")
 
         try:
-            data = resolver(url)
-            ips = list(map(lambda x: x[0], data))
-            print(ips, "ip")
-            await ctx.send(f"ips: {ips}")
+            async with ctx.typing(), ADMISSION.admit("dns"):
+                results = await resolve_many(queries, concurrency=concurrency)
+            table = format_batch(results)
+            block = f"```\n{table}\n```"
+            if len(block) <= MESSAGE_LIMIT:
+                await ctx.send(block)
+            else:
+                await ctx.send(f"Resolved {len(results)} names:",
+                               file=discord.File(io.BytesIO(table.encode()), filename="dns_batch.txt"))
+        except Overloaded as e:
+            print(f"[-] /dnsbatch rejected: {e}")
+            await ctx.send("⏳ Too many lookups right now, please try again in a minute.")
         except Exception as e:
             print(e, "exception")
             await ctx.send(f"❌ somthing went wrong")
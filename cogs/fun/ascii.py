@@ -2,6 +2,8 @@ import discord
 from discord.ext import commands
 import pyfiglet
 
+from utils.rate_limit import handle_rate_limit
+
 
 class Ascii(commands.Cog):
     def __init__(self, bot):
@@ -12,6 +14,9 @@ class Ascii(commands.Cog):
         """
         Convert text to ASCII art, e.g. !asc gn -> big ASCII 'gn'.
         """
+        if not await handle_rate_limit(ctx):
+            return
+
         # Guard so you don't blow past Discord's 2000‑char limit
         if len(text) > 20:
             await ctx.send("Please use 20 characters or fewer for ASCII art.")
@@ -2,6 +2,7 @@ import os
 import discord
 from discord.ext import commands
 from utils.ai import generate_response
+from utils.admission import ADMISSION, BACKGROUND, Overloaded
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -37,6 +38,10 @@ class AutoReplyCog(commands.Cog):
                     "Sorry, I can only respond to messages that are 100 characters or less! 😊"
                 )
                 return
+            # Auto-replies are optional: drop them while Gemini is backed up
+            # instead of fetching history for a reply that would queue anyway
+            if ADMISSION.check("gemini", BACKGROUND):
+                return
             # Start building context
             context_parts = []
 
@@ -69,8 +74,12 @@ class AutoReplyCog(commands.Cog):
 
             prompt = os.getenv("REPLY_PROMPT") + full_context
 
-            async with message.channel.typing():
-                reply = await generate_response(prompt)
+            try:
+                async with message.channel.typing():
+                    reply = await generate_response(prompt, priority=BACKGROUND)
+            except Overloaded as e:
+                print(f"[-] auto reply dropped: {e}")
+                return
 
             await message.channel.send(reply)
 
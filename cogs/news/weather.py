@@ -3,6 +3,7 @@ from discord.ext import commands
 
 from utils.rate_limit import handle_rate_limit
 from utils.ai import generate_response
+from utils.admission import Overloaded
 
 
 class Weather(commands.Cog):
@@ -38,7 +39,12 @@ Notes:
 - Include the AQI category name per the standard scale above and one-line health advice.
 - If data is unavailable, state briefly which part is unavailable.
 """
-        reply = await generate_response(prompt)
+        try:
+            reply = await generate_response(prompt)
+        except Overloaded as e:
+            print(f"[-] /weather rejected: {e}")
+            await ctx.send("⏳ Too many requests right now, please try again in a minute.")
+            return
         await ctx.send(reply)
 
 async def setup(bot):
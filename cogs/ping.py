@@ -8,6 +8,7 @@ import discord
 from discord.ext import commands
 
 from utils.rate_limit import handle_rate_limit
+from utils.admission import ADMISSION, Overloaded
 
 
 class Ping(commands.Cog):
@@ -111,34 +112,35 @@ class Ping(commands.Cog):
 
         # Try to open a TCP connection as a "ping"
         try:
-            start = loop.time()
+            async with ADMISSION.admit("http"):
+                start = loop.time()
 
-            connect_coro = asyncio.open_connection(ip_address, port)
-            reader, writer = await asyncio.wait_for(connect_coro, timeout=5.0)
+                connect_coro = asyncio.open_connection(ip_address, port)
+                reader, writer = await asyncio.wait_for(connect_coro, timeout=5.0)
 
-            latency_ms = (loop.time() - start) * 1000
+                latency_ms = (loop.time() - start) * 1000
 
-            # Send a tiny HTTP request so we can inspect headers
-            http_request = (
-                f"HEAD / HTTP/1.1\r\n"
-                f"Host: {host}\r\n"
-                f"Connection: close\r\n"
-                f"\r\n"
-            ).encode("ascii", errors="ignore")
+                # Send a tiny HTTP request so we can inspect headers
+                http_request = (
+                    f"HEAD / HTTP/1.1\r\n"
+                    f"Host: {host}\r\n"
+                    f"Connection: close\r\n"
+                    f"\r\n"
+                ).encode("ascii", errors="ignore")
 
-            try:
-                writer.write(http_request)
-                await writer.drain()
-            except Exception:
-                # If this fails, we still have the TCP latency
-                pass
+                try:
+                    writer.write(http_request)
+                    await writer.drain()
+                except Exception:
+                    # If this fails, we still have the TCP latency
+                    pass
 
-            proxy_name = await self._detect_proxy(host, reader)
+                proxy_name = await self._detect_proxy(host, reader)
 
-            # Cleanly close connection
-            writer.close()
-            with contextlib.suppress(Exception):
-                await writer.wait_closed()
+                # Cleanly close connection
+                writer.close()
+                with contextlib.suppress(Exception):
+                    await writer.wait_closed()
 
             msg_lines = [
                 "✅ Host **UP**",
@@ -155,6 +157,9 @@ class Ping(commands.Cog):
 
             await ctx.send("\n".join(msg_lines))
 
+        except Overloaded as e:
+            print(f"[-] /ping rejected: {e}")
+            await ctx.send("⏳ Too many probes running right now, please try again in a minute.")
         except asyncio.TimeoutError:
             await ctx.send(
                 f"❌ `{host}` ({ip_address}:{port}) appears to be **DOWN** or not accepting TCP connections.\n"
@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 import shodan
 
 from utils.rate_limit import handle_rate_limit
+from utils.admission import ADMISSION, Overloaded
 
 # --- Configuration ---
 load_dotenv()
@@ -46,7 +47,7 @@ class ShodanCog(commands.Cog):
         print(f"-> Received /shodan request: limit={limit}, query={query}")
 
         try:
-            async with ctx.typing():
+            async with ctx.typing(), ADMISSION.admit("shodan"):
                 loop = asyncio.get_running_loop()
                 results = await loop.run_in_executor(
                     None,
@@ -139,6 +140,10 @@ class ShodanCog(commands.Cog):
 
             await ctx.send(message)
 
+        except Overloaded as e:
+            print(f"[-] /shodan rejected: {e}")
+            await ctx.send("⏳ Too many Shodan searches right now, please try again in a minute.")
+
         except shodan.APIError as e:
             error_msg = str(e)
             print(f"[Shodan APIError] {error_msg}")
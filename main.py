@@ -1,9 +1,11 @@
 import os
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 import asyncio
 from utils.terminal_ascii import outsourced1
+from utils.rate_limit import LIMITER, FLUSH_INTERVAL
+from utils.admission import ADMISSION
 
 # --- Configuration ---
 load_dotenv()
@@ -37,12 +39,27 @@ class ShunyaBot(commands.Bot):
                     except Exception as e:
                         print(f'❌ Failed to load: {module_name}')
                         print(f'   Error: {e}')
+
+        maintain_rate_limits.start()
+        ADMISSION.start()  # event loop lag probe used for load shedding
         
         # Optional: Sync strictly to a test guild for instant updates during dev
         # TEST_GUILD = discord.Object(id=YOUR_SERVER_ID_HERE)
         # self.tree.copy_global_to(guild=TEST_GUILD)
         # await self.tree.sync(guild=TEST_GUILD)
 
+    async def close(self):
+        maintain_rate_limits.cancel()
+        ADMISSION.stop()
+        await super().close()
+        LIMITER.store.close()
+
+
+@tasks.loop(seconds=FLUSH_INTERVAL)
+async def maintain_rate_limits():
+    # Drop idle rate limit keys and flush shared buckets to disk in one batch
+    await LIMITER.maintain()
+
 # --- Instantiate Bot ---
 bot = ShunyaBot()
 
@@ -59,7 +76,7 @@ async def on_ready():
 
     print(outsourced1)
     print(f'Shunya logged in as {bot.user}')
-    print('Ready with /trap, /shodan, /asc, /tarot, /weather, /ping, /dns, and /help commands.')
+    print('Ready with /trap, /shodan, /asc, /tarot, /weather, /ping, /dns, /dnsbatch, and /help commands.')
 
 
 # --- Help Command ---
@@ -127,14 +144,37 @@ async def help_command(ctx):
     )
 
     embed.add_field(
-        name="/dns `<url>`",
+        name="/dns `<url>` `[type]`",
         value=(
-            "Resolves a domain to its IPv4 address using a custom DNS resolver.\n"
+            "Resolves a domain using a custom DNS resolver.\n"
+            "• Types: A (default), AAAA, CNAME, MX, NS, TXT, SOA; CNAME chains are followed\n"
             "• Resolver created by @gromaxhi"
         ),
         inline=False
     )
 
+    embed.add_field(
+        name="/dnsbatch `<names>` `[type]` `[attachment]`",
+        value=(
+            "Resolves up to 100 domains at once and replies with one table.\n"
+            "• Separate names with commas or newlines, or attach a .txt file\n"
+            "• Put a type after a name to override the default, e.g. `example.com MX`"
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="/dnsstats `[window]`",
+        value="Query volume, rcodes, cache hit ratio, latency percentiles and top domains over the last 1m, 15m (default) or 1h.",
+        inline=False
+    )
+
+    embed.add_field(
+        name="/dnsmetrics",
+        value="Resolver latency per hop (root, TLD, authoritative), upstream retries and timeouts, cache hit rates.",
+        inline=False
+    )
+
     embed.add_field(
         name="/trap `<eth_address>`",
         value=(
@@ -176,7 +216,7 @@ async def help_command(ctx):
     )
 
     embed.set_footer(
-        text="Shunya – calm automation with sharp tools | Rate limit: 15 req/min, 100 req/day per user."
+        text="Shunya – calm automation with sharp tools | Rate limit: 15 req/min, 100 req/day per user (/shodan 5, /weather and /dnsbatch 3)."
     )
 
     await ctx.send(embed=embed)
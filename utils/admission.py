@@ -0,0 +1,172 @@
+# admission.py
+import time
+import asyncio
+import contextlib
+from collections import deque
+
+
+# priorities, lower is served first
+INTERACTIVE = 0   # slash/prefix commands someone is waiting on
+BACKGROUND = 1    # auto-replies and other work nobody asked for directly
+
+# backend -> (concurrent calls, callers allowed to queue, seconds an interactive caller may wait)
+BACKENDS = {
+    "gemini": (4, 16, 20.0),
+    "shodan": (2, 8, 20.0),
+    "dns": (32, 64, 10.0),
+    "http": (8, 32, 10.0),
+}
+BACKGROUND_WAIT = 2.0     # background work is deferred at most this long behind other callers
+
+LAG_INTERVAL = 0.25       # how often the event loop lag probe wakes up
+LAG_SHED = 0.1            # above this loop lag background work is rejected outright
+LAG_REJECT = 1.0          # above this interactive work is rejected too
+
+
+class Overloaded(Exception):
+    def __init__(self, backend: str, reason: str):
+        super().__init__(f"{backend} overloaded: {reason}")
+        self.backend = backend
+        self.reason = reason
+
+
+class Backend:
+    """
+    Concurrency limit with a bounded wait queue per priority. A released
+    slot goes to the oldest interactive waiter before any background one.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiters = (deque(), deque())  # futures, indexed by priority
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_max = 0.0
+
+    def queued(self) -> int:
+        return len(self.waiters[INTERACTIVE]) + len(self.waiters[BACKGROUND])
+
+    async def acquire(self, priority: int, timeout: float):
+        if self.active < self.limit and not self.queued():
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        queue = self.waiters[priority]
+        queue.append(fut)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # the slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                with contextlib.suppress(ValueError):
+                    queue.remove(fut)
+            raise
+        self.wait_max = max(self.wait_max, time.perf_counter() - start)
+
+    def release(self):
+        for queue in self.waiters:
+            while queue:
+                fut = queue.popleft()
+                if not fut.done():
+                    fut.set_result(None)  # slot changes hands, active stays the same
+                    return
+        self.active -= 1
+
+    def as_dict(self) -> dict:
+        return {
+            "active": self.active, "limit": self.limit, "queued": self.queued(),
+            "admitted": self.admitted, "rejected": self.rejected, "timeouts": self.timeouts,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+
+class AdmissionController:
+    """
+    Global gate in front of slow backends. Every call runs inside
+    admit(backend, priority): it holds one of the backend's slots, queues
+    for one within a bounded queue, or is rejected with Overloaded right
+    away so the caller can answer "busy" instead of piling up coroutines.
+
+    Overload is judged from the backend's queue depth and from event loop
+    lag, measured by a probe task that sleeps LAG_INTERVAL and records how
+    late it woke up.
+    """
+
+    def __init__(self, backends: dict = BACKENDS):
+        self.backends = {name: Backend(name, *config) for name, config in backends.items()}
+        self.lag = 0.0            # smoothed seconds the loop is running behind
+        self.lag_max = 0.0
+        self.shedding = False
+        self._probe = None
+
+    def start(self):
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.ensure_future(self._measure_lag())
+
+    def stop(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = max(0.0, loop.time() - start - LAG_INTERVAL)
+            # jump up at once, decay slowly, so one quiet tick does not end a spike
+            self.lag = lag if lag > self.lag else self.lag * 0.8 + lag * 0.2
+            self.lag_max = max(self.lag_max, lag)
+            if self.lag > LAG_SHED and not self.shedding:
+                print(f"[-] event loop lag {self.lag * 1000:.0f} ms, shedding background work")
+            elif self.lag <= LAG_SHED and self.shedding:
+                print("[+] event loop lag back to normal")
+            self.shedding = self.lag > LAG_SHED
+
+    def check(self, name: str, priority: int = INTERACTIVE) -> str | None:
+        """Why a call to backend name would be rejected right now, or None if it would be admitted."""
+        backend = self.backends[name]
+        if self.lag > (LAG_SHED if priority == BACKGROUND else LAG_REJECT):
+            return f"event loop lag {self.lag * 1000:.0f} ms"
+        if backend.queued() >= backend.max_queue:
+            return f"{backend.queued()} calls already queued"
+        if priority == BACKGROUND and backend.waiters[INTERACTIVE]:
+            return "interactive calls are waiting"
+        return None
+
+    @contextlib.asynccontextmanager
+    async def admit(self, name: str, priority: int = INTERACTIVE):
+        backend = self.backends[name]
+        reason = self.check(name, priority)
+        if reason is not None:
+            backend.rejected += 1
+            raise Overloaded(name, reason)
+        try:
+            await backend.acquire(priority, BACKGROUND_WAIT if priority == BACKGROUND else backend.timeout)
+        except asyncio.TimeoutError:
+            backend.timeouts += 1
+            raise Overloaded(name, "timed out waiting for a slot") from None
+        backend.admitted += 1
+        try:
+            yield
+        finally:
+            backend.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "loop_lag_ms": self.lag * 1000,
+            "loop_lag_max_ms": self.lag_max * 1000,
+            "shedding": self.shedding,
+            "backends": {name: backend.as_dict() for name, backend in self.backends.items()},
+        }
+
+
+ADMISSION = AdmissionController()
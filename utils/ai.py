@@ -4,6 +4,8 @@ from google import genai
 from dotenv import load_dotenv
 from google.genai import types
 
+from utils.admission import ADMISSION, INTERACTIVE
+
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -13,7 +15,8 @@ GEMINI_MODEL = "gemini-2.5-flash-lite"
 client = genai.Client(api_key=GEMINI_API_KEY)
 
 # Async helper for Discord commands
-async def generate_response(prompt: str, enable_search: bool = True) -> str:
+# Raises utils.admission.Overloaded when Gemini calls are backed up
+async def generate_response(prompt: str, enable_search: bool = True, priority: int = INTERACTIVE) -> str:
     tools = []
     if enable_search:
         # Enable Google Search grounding
@@ -21,12 +24,13 @@ async def generate_response(prompt: str, enable_search: bool = True) -> str:
 
     # Use the async client
     aclient = client.aio
-    resp = await aclient.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            tools=tools,
-        ),
-    )
+    async with ADMISSION.admit("gemini", priority):
+        resp = await aclient.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                tools=tools,
+            ),
+        )
     # print(resp.text)
     return resp.text or "No response."
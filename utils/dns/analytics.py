@@ -0,0 +1,156 @@
+# analytics.py
+import time
+from array import array
+
+
+SLOT_SECONDS = 60          # one slot per minute
+SLOTS = 60                 # ring of one hour
+WINDOWS = {"1m": 1, "15m": 15, "1h": 60}  # window name -> slots
+TOP_K = 64                 # heavy-hitter counters kept per slot
+RCODES = ("NOERROR", "NXDOMAIN", "SERVFAIL", "OTHER")
+
+# HDR-style latency buckets over microseconds: exact below 32 us, then 16
+# linear sub-buckets per power of two (<= 6.25% relative error) up to ~2 min
+SUB_BUCKETS = 16
+LATENCY_BUCKETS = 2 * SUB_BUCKETS + 22 * SUB_BUCKETS
+
+
+def latency_bucket(us: int) -> int:
+    if us < 2 * SUB_BUCKETS:
+        return max(0, us)
+    shift = us.bit_length() - 5  # keeps the top 5 bits: 16..31
+    return min(LATENCY_BUCKETS - 1, 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS)
+
+
+def bucket_value(index: int) -> float:
+    """Midpoint of a latency bucket, in microseconds."""
+    if index < 2 * SUB_BUCKETS:
+        return float(index)
+    shift = (index - 2 * SUB_BUCKETS) // SUB_BUCKETS + 1
+    mantissa = (index - 2 * SUB_BUCKETS) % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa << shift) + ((mantissa + 1) << shift)) / 2
+
+
+class SpaceSaving:
+    """
+    Heavy-hitter sketch (Metwally et al.): at most capacity counters; a new
+    key takes over the smallest counter and inherits its count as error, so
+    any key with true frequency above total/capacity is always present.
+    """
+
+    __slots__ = ("capacity", "counts", "errors")
+
+    def __init__(self, capacity: int = TOP_K):
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+
+    def add(self, key: str):
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.errors[key] = 0
+        else:
+            victim = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[key] = floor + 1
+            self.errors[key] = floor
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+
+
+class QueryAnalytics:
+    """
+    Incremental aggregates over completed queries, kept per minute in a ring
+    of SLOTS slots. Every column is an array indexed by slot (the latency
+    histogram is one flat array of SLOTS x LATENCY_BUCKETS counts), so
+    recording a query is a handful of increments and reading a window costs
+    at most SLOTS slots, however many queries they hold.
+    """
+
+    def __init__(self):
+        self.slot_minute = array("q", [-1] * SLOTS)
+        self.queries = array("Q", bytes(8 * SLOTS))
+        self.cache_hits = array("Q", bytes(8 * SLOTS))
+        self.rcodes = {rcode: array("Q", bytes(8 * SLOTS)) for rcode in RCODES}
+        self.latency = array("I", bytes(4 * SLOTS * LATENCY_BUCKETS))
+        self.top = [SpaceSaving() for _ in range(SLOTS)]
+        self._zero_histogram = array("I", bytes(4 * LATENCY_BUCKETS))
+        self.started = time.time()
+
+    def _slot(self, minute: int) -> int:
+        slot = minute % SLOTS
+        if self.slot_minute[slot] != minute:
+            # slot last held data from an hour (or more) ago, start it over
+            self.slot_minute[slot] = minute
+            self.queries[slot] = 0
+            self.cache_hits[slot] = 0
+            for column in self.rcodes.values():
+                column[slot] = 0
+            start = slot * LATENCY_BUCKETS
+            self.latency[start:start + LATENCY_BUCKETS] = self._zero_histogram
+            self.top[slot].clear()
+        return slot
+
+    def record(self, domain: str, rcode: str, latency_ms: float, cached: bool, now: float | None = None):
+        now = time.time() if now is None else now
+        slot = self._slot(int(now // SLOT_SECONDS))
+        self.queries[slot] += 1
+        self.cache_hits[slot] += bool(cached)
+        self.rcodes[rcode if rcode in self.rcodes else "OTHER"][slot] += 1
+        self.latency[slot * LATENCY_BUCKETS + latency_bucket(int(latency_ms * 1000))] += 1
+        self.top[slot].add(domain.lower().strip("."))
+
+    def _live_slots(self, window: str, now: float) -> list:
+        minute = int(now // SLOT_SECONDS)
+        span = WINDOWS[window]
+        return [s for s in range(SLOTS) if minute - span < self.slot_minute[s] <= minute]
+
+    def summary(self, window: str = "15m", top_n: int = 10, now: float | None = None) -> dict:
+        """Totals, rcode counts, hit ratio, latency quantiles (ms) and top domains for a window."""
+        now = time.time() if now is None else now
+        slots = self._live_slots(window, now)
+        queries = sum(self.queries[s] for s in slots)
+        hits = sum(self.cache_hits[s] for s in slots)
+        seconds = min(WINDOWS[window] * SLOT_SECONDS, max(1.0, now - self.started))
+
+        histogram = [0] * LATENCY_BUCKETS
+        for s in slots:
+            start = s * LATENCY_BUCKETS
+            for i, n in enumerate(self.latency[start:start + LATENCY_BUCKETS]):
+                if n:
+                    histogram[i] += n
+
+        merged: dict[str, int] = {}
+        for s in slots:
+            for domain, count in self.top[s].counts.items():
+                merged[domain] = merged.get(domain, 0) + count
+
+        return {
+            "window": window,
+            "queries": queries,
+            "qps": queries / seconds,
+            "cache_hit_ratio": hits / queries if queries else 0.0,
+            "rcodes": {rcode: sum(column[s] for s in slots) for rcode, column in self.rcodes.items()},
+            "latency_ms": {f"p{int(q * 100)}": _quantile(histogram, queries, q) / 1000 for q in (0.5, 0.95, 0.99)},
+            "top_domains": sorted(merged.items(), key=lambda item: -item[1])[:top_n],
+        }
+
+
+def _quantile(histogram: list, total: int, q: float) -> float:
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(histogram):
+        seen += n
+        if n and seen >= rank:
+            return bucket_value(i)
+    return 0.0
+
+
+ANALYTICS = QueryAnalytics()
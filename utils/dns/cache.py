@@ -1,49 +1,355 @@
 # dns_cache.py
-import time, json, lmdb
+import os, time, json, struct, socket, lmdb
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Dict, Any
 
 
 # Path to the project root (adjust .parent levels if needed)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent  # e.g. file is in utils/, project root is two levels up
-DEFAULT_DIR = str(PROJECT_ROOT / "global_cache" / "dns_cache")
+# DNS_CACHE_DIR points a separate process (e.g. the benchmarks) at its own cache
+DEFAULT_DIR = os.getenv("DNS_CACHE_DIR") or str(PROJECT_ROOT / "global_cache" / "dns_cache")
+
+ENV = lmdb.open(DEFAULT_DIR, map_size=10*1024*1024, subdir=True, max_dbs=2, lock=True)
+RECORDS_DB = ENV.open_db(b"records")
+# expiry index: 8-byte big-endian expiry second + record key -> b"", sorted oldest first
+EXPIRY_DB = ENV.open_db(b"expiry")
+
+# how often (seconds) and how much the background sweeper purges
+SWEEP_INTERVAL = 30
+SWEEP_BATCH = 256
+
+# Once the sets kept for STALE_WINDOW fill this much of map_size, writes evict
+# the sets that expire soonest down to LOW_WATER. Deletes need free pages too
+# (copy-on-write), so this has to start well before LMDB reports MAP_FULL.
+HIGH_WATER = 0.85
+LOW_WATER = 0.70
+EVICT_BATCH = 64  # sets per eviction transaction, each may copy a page
+
+# RFC 8767 serve-stale: expired sets are kept this long after expiry and can be
+# handed out with STALE_TTL when the authoritative servers cannot be reached
+STALE_WINDOW = 24 * 3600
+STALE_TTL = 30
+
+# In-process L1 tier in front of LMDB: (name, rtype, rclass) -> ([(value, expires_at, ttl)], set_expires_at, flags)
+L1_MAX_ENTRIES = 4096
+_l1: "OrderedDict[tuple, tuple[list, float, int]]" = OrderedDict()
+
+# RFC 2308 negative answers are stored as empty sets with one of these flags
+FLAG_NXDOMAIN = 0x01
+FLAG_NODATA = 0x02
+NEGATIVE_FLAGS = {FLAG_NXDOMAIN: "NXDOMAIN", FLAG_NODATA: "NODATA"}
+MAX_NEGATIVE_TTL = 3 * 3600  # RFC 2308 section 5 recommends capping at 1-3 hours
+
+STATS = {"l1_hits": 0, "l1_misses": 0, "lmdb_hits": 0, "lmdb_misses": 0}
 
-ENV = lmdb.open(DEFAULT_DIR, map_size=10*1024*1024, subdir=True, max_dbs=1, lock=True)
 
 def _make_key(name: str, rtype: str, rclass: str = "IN") -> bytes:
     return f"{name.lower()}|{rtype.upper()}|{rclass.upper()}".encode("utf-8")
 
 
+# Stored value format, version 1 (all big-endian):
+#   header  ">BBHd"  version, flags, record count, set_expires_at
+#                    (flags FLAG_NXDOMAIN / FLAG_NODATA mark a cached negative answer, whose
+#                    only record, if any, is the zone SOA as "owner mname rname serial ...")
+#   record  ">dIB"   expires_at, original ttl, value kind, followed by the value:
+#                    kind 4 -> 4 packed bytes, kind 6 -> 16 packed bytes,
+#                    kind 0 -> u8 length + ascii name, kind 1 -> u16 length + utf-8 text
+# Values written by older versions are JSON objects (first byte "{") and are
+# rewritten in this format the first time they are read.
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(">BBHd")
+_RECORD = struct.Struct(">dIB")
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+KIND_NAME, KIND_TEXT, KIND_IPV4, KIND_IPV6 = 0, 1, 4, 6
+
+
+def _pack_value(value: str) -> tuple[int, bytes]:
+    # addresses are stored packed, but only if that round-trips to the same string
+    for kind, family in ((KIND_IPV4, socket.AF_INET), (KIND_IPV6, socket.AF_INET6)):
+        try:
+            packed = socket.inet_pton(family, value)
+        except (OSError, ValueError):
+            continue
+        if socket.inet_ntop(family, packed) == value:
+            return kind, packed
+    data = value.encode("utf-8")
+    if len(data) <= 255 and value.isascii():
+        return KIND_NAME, _U8.pack(len(data)) + data
+    return KIND_TEXT, _U16.pack(len(data)) + data
+
+
+def encode_set(records: list, set_expires_at: float, flags: int = 0) -> bytes:
+    """records: iterable of (value, expires_at, ttl)."""
+    parts = [_HEADER.pack(FORMAT_VERSION, flags, len(records), set_expires_at)]
+    for value, expires_at, ttl in records:
+        kind, payload = _pack_value(value)
+        parts.append(_RECORD.pack(expires_at, ttl, kind) + payload)
+    return b"".join(parts)
+
+
+def decode_set(raw) -> tuple[list, float, int]:
+    """
+    Decode a stored value into ([(value, expires_at, ttl)], set_expires_at, flags).
+    Binary values are read straight out of the buffer with struct.unpack_from.
+    """
+    buf = memoryview(raw)
+    if len(buf) and buf[0] == 0x7B:  # "{", legacy JSON value
+        obj = json.loads(bytes(buf).decode("utf-8"))
+        records = [(r["value"], r.get("expires_at", 0), r.get("ttl", 0)) for r in obj.get("records", [])]
+        return records, obj.get("set_expires_at", 0), 0
+
+    version, flags, count, set_expires_at = _HEADER.unpack_from(buf, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unknown cache value version {version}")
+    offset = _HEADER.size
+    records = []
+    for _ in range(count):
+        expires_at, ttl, kind = _RECORD.unpack_from(buf, offset)
+        offset += _RECORD.size
+        if kind == KIND_IPV4:
+            value = socket.inet_ntop(socket.AF_INET, buf[offset:offset + 4])
+            offset += 4
+        elif kind == KIND_IPV6:
+            value = socket.inet_ntop(socket.AF_INET6, buf[offset:offset + 16])
+            offset += 16
+        elif kind == KIND_NAME:
+            length = buf[offset]
+            value = str(buf[offset + 1:offset + 1 + length], "ascii")
+            offset += 1 + length
+        elif kind == KIND_TEXT:
+            (length,) = _U16.unpack_from(buf, offset)
+            value = str(buf[offset + 2:offset + 2 + length], "utf-8")
+            offset += 2 + length
+        else:
+            raise ValueError(f"unknown cache value kind {kind}")
+        records.append((value, expires_at, ttl))
+    return records, set_expires_at, flags
+
+
+def _index_key(expires_at: float, key: bytes) -> bytes:
+    return struct.pack(">Q", int(expires_at)) + key
+
+
+def _set_expires_at(raw) -> float:
+    try:
+        if raw[0] != 0x7B:
+            return _HEADER.unpack_from(raw, 0)[3]
+        return decode_set(raw)[1]
+    except Exception:
+        return 0
+
+
+def _put(txn, key: bytes, value: bytes, set_expires_at: float):
+    # keep exactly one index entry per stored set
+    old = txn.get(key, db=RECORDS_DB)
+    if old is not None:
+        txn.delete(_index_key(_set_expires_at(old), key), db=EXPIRY_DB)
+    txn.put(key, value, db=RECORDS_DB)
+    txn.put(_index_key(set_expires_at, key), b"", db=EXPIRY_DB)
+
+
+def _delete(txn, key: bytes):
+    old = txn.get(key, db=RECORDS_DB)
+    if old is not None:
+        txn.delete(_index_key(_set_expires_at(old), key), db=EXPIRY_DB)
+        txn.delete(key, db=RECORDS_DB)
+
+
+def _pages_in_use(txn) -> int:
+    stats = [txn.stat(RECORDS_DB), txn.stat(EXPIRY_DB), txn.stat()]
+    return sum(s["branch_pages"] + s["leaf_pages"] + s["overflow_pages"] for s in stats)
+
+
+def _make_room():
+    """Evict the sets closest to expiry (stale ones first) while the map is above HIGH_WATER."""
+    info = ENV.info()
+    total_pages = info["map_size"] // ENV.stat()["psize"]
+    # last_pgno never shrinks, but below the mark there is nothing to count
+    if info["last_pgno"] < total_pages * HIGH_WATER:
+        return
+    with ENV.begin() as txn:
+        if _pages_in_use(txn) < total_pages * HIGH_WATER:
+            return
+    evicted, size = 0, EVICT_BATCH
+    while True:
+        try:
+            with ENV.begin(write=True) as txn:
+                if _pages_in_use(txn) < total_pages * LOW_WATER:
+                    break
+                cur = txn.cursor(db=EXPIRY_DB)
+                cur.first()
+                batch = 0
+                while batch < size and cur.key():
+                    txn.delete(cur.key()[8:], db=RECORDS_DB)
+                    cur.delete()
+                    batch += 1
+        except lmdb.MapFullError:
+            # not even enough free pages for the copies a delete makes, try fewer
+            if size == 1:
+                break
+            size //= 2
+            continue
+        if not batch:
+            break
+        evicted += batch
+    print(f"[-] dns cache map {HIGH_WATER:.0%} full, evicted {evicted} sets closest to expiry")
+
+
+def _store(key: bytes, value: bytes, set_expires_at: float):
+    _make_room()
+    try:
+        with ENV.begin(write=True) as txn:
+            _put(txn, key, value, set_expires_at)
+    except lmdb.MapFullError:
+        # the answer is still returned and kept in L1, only the LMDB copy is lost
+        print("[-] dns cache map is full, not storing", key.decode("utf-8", "replace"))
+
+
+def _migrate_legacy():
+    # entries written before the records/expiry sub-dbs lived in the main db
+    with ENV.begin(write=True) as txn:
+        legacy = [(k, v) for k, v in txn.cursor() if b"|" in k]
+        for k, v in legacy:
+            _put(txn, k, v, _set_expires_at(v))
+            txn.delete(k)
+    if legacy:
+        print(f"[+] moved {len(legacy)} cached DNS sets into the indexed store")
+
+
+_migrate_legacy()
+
+
+def _l1_key(name: str, rtype: str, rclass: str = "IN") -> tuple:
+    return (name.lower(), rtype.upper(), rclass.upper())
+
+
+def _l1_put(key: tuple, records: list, set_expires_at: float, flags: int = 0):
+    _l1[key] = (records, set_expires_at, flags)
+    _l1.move_to_end(key)
+    while len(_l1) > L1_MAX_ENTRIES:
+        _l1.popitem(last=False)
+
+
+def _unique(records: list) -> list:
+    # remove duplicates by value, keeping the first occurrence
+    seen = set()
+    unique = []
+    for record in records:
+        if record[0] not in seen:
+            seen.add(record[0])
+            unique.append(record)
+    return unique
+
+
+def _live(records: list, now: float) -> list:
+    # TTL counts down from the absolute expiry, so cached copies never go stale
+    return [{"value": value, "ttl": int(expires_at - now), "orig_ttl": ttl}
+            for value, expires_at, ttl in records if expires_at > now]
+
+
 def get_records(name: str, rtype: str, rclass: str = "IN"):
     now = time.time()
+    l1_key = _l1_key(name, rtype, rclass)
+    entry = _l1.get(l1_key)
+    if entry is not None:
+        records, set_expires_at, flags = entry
+        if set_expires_at > now:
+            _l1.move_to_end(l1_key)
+            STATS["l1_hits"] += 1
+            return [] if flags in NEGATIVE_FLAGS else _live(records, now)
+        del _l1[l1_key]
+    STATS["l1_misses"] += 1
+
     key = _make_key(name, rtype, rclass)
-    with ENV.begin() as txn:
+    # buffers=True hands back a view into the memory map, decoded in place
+    with ENV.begin(db=RECORDS_DB, buffers=True) as txn:
         raw = txn.get(key)
         if not raw:
+            STATS["lmdb_misses"] += 1
             return []
+        legacy = raw[0] == 0x7B
+        try:
+            records, set_expires_at, flags = decode_set(raw)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            records, set_expires_at, flags = [], 0, 0
 
-        obj = json.loads(raw.decode("utf-8"))
+    # expired set
+    if set_expires_at <= now:
+        STATS["lmdb_misses"] += 1
+        return []
+
+    if legacy:
+        with ENV.begin(write=True) as txn:
+            _put(txn, key, encode_set(records, set_expires_at), set_expires_at)
+
+    STATS["lmdb_hits"] += 1
+    records = _unique(records)
+    # negative entries go to L1 too, so the get_negative() that follows is free
+    _l1_put(l1_key, records, set_expires_at, flags)
+    return [] if flags in NEGATIVE_FLAGS else _live(records, now)
 
-        # expired set
-        if obj.get("set_expires_at", 0) <= now:
-            return []
 
-        live = []
-        for r in obj.get("records", []):
-            expires_at = r.get("expires_at", 0)
-            if expires_at > now:
-                remaining_ttl = int(expires_at - now)
-                live.append({"value": r["value"], "ttl": remaining_ttl})
+def get_negative(name: str, rtype: str, rclass: str = "IN"):
+    """
+    ("NXDOMAIN" or "NODATA", seconds left, (SOA owner, SOA value) or None) for
+    a cached negative answer, else None. get_records() returns [] for these,
+    call this when it comes back empty.
+    """
+    now = time.time()
+    entry = _l1.get(_l1_key(name, rtype, rclass))
+    if entry is None:
+        with ENV.begin(db=RECORDS_DB, buffers=True) as txn:
+            raw = txn.get(_make_key(name, rtype, rclass))
+            if not raw or raw[0] == 0x7B:
+                return None
+            try:
+                if _HEADER.unpack_from(raw, 0)[1] not in NEGATIVE_FLAGS:
+                    return None
+                entry = decode_set(raw)
+            except (ValueError, struct.error, UnicodeDecodeError):
+                return None
+    records, set_expires_at, flags = entry
+    if flags not in NEGATIVE_FLAGS or set_expires_at <= now:
+        return None
+    soa = tuple(records[0][0].split(" ", 1)) if records else None
+    return NEGATIVE_FLAGS[flags], int(set_expires_at - now), soa
 
-        # remove duplicates by value, keeping the first occurrence
-        seen = set()
-        unique_live = []
-        for r in live:
-            if r["value"] not in seen:
-                seen.add(r["value"])
-                unique_live.append(r)
 
-        return unique_live
+def set_negative(name: str, rtype: str, rcode: str, ttl: int, rclass: str = "IN", soa: tuple | None = None):
+    """
+    Cache an NXDOMAIN or NODATA answer for ttl seconds (capped at
+    MAX_NEGATIVE_TTL), with the (owner, value) of the zone SOA that proves
+    it, so it can be handed on in the authority section (RFC 2308 section 3).
+    """
+    flags = FLAG_NXDOMAIN if rcode == "NXDOMAIN" else FLAG_NODATA
+    ttl = min(max(0, int(ttl)), MAX_NEGATIVE_TTL)
+    set_expires_at = time.time() + ttl
+    records = [(f"{soa[0]} {soa[1]}", set_expires_at, ttl)] if soa else []
+    _store(_make_key(name, rtype, rclass), encode_set(records, set_expires_at, flags), set_expires_at)
+    _l1_put(_l1_key(name, rtype, rclass), records, set_expires_at, flags)
+
+
+def get_stale(name: str, rtype: str, rclass: str = "IN", now: float | None = None):
+    """
+    Records of a set that has expired less than STALE_WINDOW ago, each with
+    ttl STALE_TTL, or [] if there is no such set. Only meant as a fallback
+    after get_records() missed and fresh resolution failed or was too slow.
+    """
+    now = time.time() if now is None else now
+    with ENV.begin(db=RECORDS_DB, buffers=True) as txn:
+        raw = txn.get(_make_key(name, rtype, rclass))
+        if not raw:
+            return []
+        try:
+            records, set_expires_at, flags = decode_set(raw)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            return []
+    if flags in NEGATIVE_FLAGS or set_expires_at + STALE_WINDOW <= now:
+        return []
+    return [{"value": value, "ttl": STALE_TTL, "orig_ttl": ttl, "stale": True}
+            for value, _, ttl in _unique(records)]
 
 
 def set_records(name: str, values_with_ttl: list, rtype: str, rclass: str = "IN"):
@@ -53,61 +359,75 @@ def set_records(name: str, values_with_ttl: list, rtype: str, rclass: str = "IN"
     for val, ttl in values_with_ttl:
         ttl = max(0, int(ttl))
         exp = now + ttl
-        records.append({"value": val, "ttl": ttl, "cached_at": now, "expires_at": exp})
+        records.append((val, exp, ttl))
         set_expires_at = exp if set_expires_at is None else min(set_expires_at, exp)
-    value_obj = {"records": records, "set_expires_at": set_expires_at or now}
-    key = _make_key(name, rtype, rclass)
-    with ENV.begin(write=True) as txn:
-        txn.put(key, json.dumps(value_obj, separators=(",", ":")).encode("utf-8"))
+    set_expires_at = set_expires_at or now
+    records = _unique(records)
+    _store(_make_key(name, rtype, rclass), encode_set(records, set_expires_at), set_expires_at)
+    # write-through so the next read never touches LMDB
+    _l1_put(_l1_key(name, rtype, rclass), records, set_expires_at)
 
 
 def delete_key(name: str, rtype: str, rclass: str = "IN"):
     key = _make_key(name, rtype, rclass)
+    _l1.pop(_l1_key(name, rtype, rclass), None)
     with ENV.begin(write=True) as txn:
-        txn.delete(key)
+        _delete(txn, key)
 
 
 def clear_all():
+    _l1.clear()
     with ENV.begin(write=True) as txn:
-        cur = txn.cursor()
-        # delete all K/V pairs
-        for k, _v in list(cur):  # list() to snapshot keys before deleting
-            txn.delete(k)
+        # empty both sub-dbs but keep their handles valid
+        txn.drop(RECORDS_DB, delete=False)
+        txn.drop(EXPIRY_DB, delete=False)
 
 
-def purge_expired(now: float | None = None):
+def purge_expired(now: float | None = None, limit: int | None = None):
+    """
+    Delete sets that expired more than STALE_WINDOW ago, oldest first,
+    walking the expiry index so the cost is proportional to what gets
+    removed (at most limit sets per call), not to the size of the cache.
+    """
     now = time.time() if now is None else now
+    cutoff = now - STALE_WINDOW
     removed = 0
     with ENV.begin(write=True) as txn:
-        cur = txn.cursor()
-        for k, v in list(cur):
-            try:
-                obj = json.loads(v.decode("utf-8"))
-            except Exception:
-                txn.delete(k); removed += 1; continue
-            if obj.get("set_expires_at", 0) <= now:
-                txn.delete(k); removed += 1
-            else:
-                # Optional: rewrite value keeping only live records which are not expired
-                live = [r for r in obj.get("records", []) if r.get("expires_at", 0) > now]
-                if len(live) != len(obj.get("records", [])):
-                    obj["records"] = live
-                    obj["set_expires_at"] = min((r["expires_at"] for r in live), default=0)
-                    txn.put(k, json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+        cur = txn.cursor(db=EXPIRY_DB)
+        cur.first()
+        while limit is None or removed < limit:
+            index_key = cur.key()
+            # an empty key means the cursor ran off the end (also after deleting the last entry)
+            if not index_key or struct.unpack(">Q", index_key[:8])[0] > cutoff:
+                break
+            txn.delete(index_key[8:], db=RECORDS_DB)
+            cur.delete()  # cursor moves on to the next entry
+            removed += 1
     return removed
 
 
+def cache_stats() -> dict:
+    """Hit/miss counters per tier plus the current L1 size."""
+    return {**STATS, "l1_entries": len(_l1)}
+
+
 def view_all():
     """
-    Return a list of dicts: {"key": "name|rtype|rclass", "value": <parsed JSON>}.
+    Return a list of dicts: {"key": "name|rtype|rclass", "value": <decoded set>}.
     Raw values are returned without filtering expired per-record entries.
     """
     out = []
-    with ENV.begin() as txn:
+    with ENV.begin(db=RECORDS_DB) as txn:
         cur = txn.cursor()
         for k, v in cur:
             try:
-                obj = json.loads(v.decode("utf-8"))
+                records, set_expires_at, flags = decode_set(v)
+                obj = {
+                    "records": [{"value": val, "ttl": ttl, "expires_at": exp} for val, exp, ttl in records],
+                    "set_expires_at": set_expires_at,
+                }
+                if flags in NEGATIVE_FLAGS:
+                    obj["negative"] = NEGATIVE_FLAGS[flags]
             except Exception:
                 obj = {"_error": "unable to decode value"}
             out.append({"key": k.decode("utf-8", errors="replace"), "value": obj})
@@ -0,0 +1,116 @@
+# delegation.py
+import time
+from collections import OrderedDict
+
+
+MAX_ZONES = 10000
+
+
+def normalize(name: str) -> str:
+    return name.lower().strip(".")
+
+
+def parent_zones(name: str):
+    """Yield name, then each ancestor zone, ending with the root ("")."""
+    name = normalize(name)
+    while name:
+        yield name
+        _, _, name = name.partition(".")
+    yield ""
+
+
+def in_zone(name: str, zone: str) -> bool:
+    name, zone = normalize(name), normalize(zone)
+    return not zone or name == zone or name.endswith("." + zone)
+
+
+class Delegation:
+    """NS set for one zone cut plus whatever addresses we know for those servers."""
+
+    __slots__ = ("zone", "nameservers", "addresses", "expires_at")
+
+    def __init__(self, zone: str, nameservers: list, expires_at: float):
+        self.zone = zone
+        self.nameservers = nameservers
+        self.addresses: dict[str, tuple[list, float]] = {}  # ns name -> (ips, expires_at)
+        self.expires_at = expires_at
+
+    def add_addresses(self, ns_name: str, ips: list, ttl: int, now: float | None = None):
+        now = time.time() if now is None else now
+        ns_name = normalize(ns_name)
+        # glue and resolved addresses never outlive the NS set itself
+        self.addresses[ns_name] = (list(ips), min(now + max(0, int(ttl)), self.expires_at))
+
+    def server_ips(self, now: float | None = None) -> list:
+        now = time.time() if now is None else now
+        ips = []
+        for ns_name in self.nameservers:
+            entry = self.addresses.get(ns_name)
+            if entry and entry[1] > now:
+                ips.extend(ip for ip in entry[0] if ip not in ips)
+        return ips
+
+
+class DelegationCache:
+    """
+    In-memory cache of zone cuts learned from referrals, keyed by zone name.
+
+    Lookups start from the closest cached ancestor of the query name, so once
+    a TLD (or any deeper zone) has been seen the resolver skips straight to its
+    servers until the NS TTL runs out. The root zone is pinned from root hints.
+    """
+
+    def __init__(self, max_zones: int = MAX_ZONES):
+        self.max_zones = max_zones
+        self._zones: "OrderedDict[str, Delegation]" = OrderedDict()
+        self._root: Delegation | None = None
+
+    def set_roots(self, roots: list):
+        """roots: list of (server name, ip) from root hints."""
+        root = Delegation("", [], float("inf"))
+        for name, ip in roots:
+            name = normalize(name)
+            root.nameservers.append(name)
+            root.addresses[name] = ([ip], float("inf"))
+        self._root = root
+
+    def put(self, zone: str, nameservers: list, ttl: int, glue: dict | None = None) -> Delegation:
+        """
+        Store the NS set for zone. glue maps ns name -> list of (ip, ttl).
+        """
+        now = time.time()
+        zone = normalize(zone)
+        delegation = Delegation(zone, [normalize(ns) for ns in nameservers], now + max(0, int(ttl)))
+        for ns_name, addrs in (glue or {}).items():
+            if addrs:
+                delegation.add_addresses(ns_name, [ip for ip, _ in addrs], min(t for _, t in addrs), now)
+
+        self._zones[zone] = delegation
+        self._zones.move_to_end(zone)
+        while len(self._zones) > self.max_zones:
+            self._zones.popitem(last=False)
+        return delegation
+
+    def get(self, zone: str) -> Delegation | None:
+        zone = normalize(zone)
+        if not zone:
+            return self._root
+        delegation = self._zones.get(zone)
+        if delegation is None:
+            return None
+        if delegation.expires_at <= time.time():
+            del self._zones[zone]
+            return None
+        self._zones.move_to_end(zone)
+        return delegation
+
+    def closest(self, name: str) -> Delegation | None:
+        """Deepest unexpired zone cut at or above name (the root if nothing else)."""
+        for zone in parent_zones(name):
+            delegation = self.get(zone)
+            if delegation is not None:
+                return delegation
+        return None
+
+    def clear(self):
+        self._zones.clear()
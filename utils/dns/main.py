@@ -1,20 +1,60 @@
+import os
 import re
+import json
 import requests
-import socket
 import random
 import time
-
-from utils.dns.cache import get_records, set_records, print_view, purge_expired
+import asyncio
+import contextvars
+from pathlib import Path
+
+from utils.dns.cache import get_records, get_stale, get_negative, set_records, set_negative, cache_stats, print_view, PROJECT_ROOT
+from utils.dns.transport import DNS_PORT, get_multiplexer, get_tcp_pool
+from utils.dns.delegation import DelegationCache, in_zone, normalize
+from utils.dns.srtt import ServerSelector
+from utils.dns.singleflight import SingleFlight
+from utils.dns.prefetch import HitCounter, needs_refresh, PREFETCH_MIN_SCORE
+from utils.dns.metrics import METRICS, stage_for
+from utils.dns.wire import parse_message, encode_name, ParseError, TYPE_A, TYPE_NS, TYPE_CNAME, TYPE_MX, TYPE_SOA, TYPE_CODES, RCODE_NAMES
 
 root_ips = []
-nearest_root = []
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(2.0) 
+QUERY_TIMEOUT = 2.0
+UPSTREAM_PORT = DNS_PORT  # port every root/TLD/authoritative server is asked on
+MAX_REFERRALS = 16       # zone cuts followed for a single name
+MAX_GLUELESS_DEPTH = 4   # nested lookups for nameserver addresses without glue
+MAX_CNAME_CHAIN = 8      # CNAME links followed before giving up
+# RFC 8767 client response timer: past this, a stale answer (if any) is sent
+# while resolution carries on in the background
+STALE_ANSWER_DEADLINE = 1.8
+
+# record types /dns and resolve() accept
+SUPPORTED_TYPES = ("A", "AAAA", "CNAME", "MX", "NS", "TXT", "SOA")
+
+BATCH_CONCURRENCY = 16   # lookups resolve_many() keeps in flight at once
+
+DELEGATIONS = DelegationCache()
+SERVERS = ServerSelector()
+# identical uncached lookups in flight at once share one resolution
+IN_FLIGHT = SingleFlight()
+# decaying per-key hit counts; popular sets are refreshed just before they expire
+POPULARITY = HitCounter()
+_background = set()  # strong references to running prefetch and stale-refresh tasks
+# per-resolve() seconds spent in root/TLD/authoritative hops, logged with the query
+_stage_times = contextvars.ContextVar("dns_stage_times", default=None)
+
+ROOT_HINTS = Path(__file__).resolve().parent / "root.hints"
+# parsed root hints plus last measured root RTTs, so a restart is warm at once
+ROOT_STATE_FILE = PROJECT_ROOT / "global_cache" / "dns_roots.json"
+ROOT_PROBE_DEADLINE = 3.0  # seconds for the whole concurrent root probe
+
+_bootstrapped = False
+_probe_task = None
 
 
 def update_root_address():
-	with open("utils/dns/root.hints","r+") as f:
+	root_ips.clear()
+	with open(ROOT_HINTS,"r") as f:
 		nm = f.read().splitlines()
 		for line in nm:
 			if "A " in line and "AAAA" not in line:
@@ -75,331 +115,547 @@ def make_opt_record(udp_payload_size=4096, extended_rcode=0, edns_version=0, z=0
 def query(domain, qtype, qclass=1, use_edns=False):
     arcount = 1 if use_edns else 0
     header = make_header(recursion_desired=False, qd=1, an=0, ns=0, ar=arcount)
-    qname = qname_creator(domain)
-    question = qname + qtype.to_bytes(2, "big") + qclass.to_bytes(2, "big")
+    question = encode_name(domain) + qtype.to_bytes(2, "big") + qclass.to_bytes(2, "big")
     if use_edns:
         question += make_opt_record()
     return header + question
 
 
+async def send_query(server_ip, packet, timeout=QUERY_TIMEOUT, port=DNS_PORT):
+    """Send a DNS packet over UDP without blocking the event loop.
 
-def check_nearest_root():
-	global nearest_root
-
-	best = {"value":(0,0),"time":100}
+    Goes through the shared multiplexer, so the reply is matched on
+    message ID, server and question. Raises asyncio.TimeoutError if the
+    server does not answer in time.
+    """
+    return await get_multiplexer().query(server_ip, packet, timeout, port)
 
-	for i in root_ips:
 
-		start_time = time.perf_counter()
+async def send_query_tcp(server_ip, packet, timeout=QUERY_TIMEOUT, port=DNS_PORT):
+    """Same as send_query() over a pooled, pipelined TCP connection."""
+    return await get_tcp_pool().query(server_ip, packet, timeout, port)
 
-		UDP_IP = i[1]
-		UDP_PORT = 53
-		add = (UDP_IP, UDP_PORT)
-		packet = query(".com",2)
-		# A = 1 ,NS = 2
-		try:
-			addr = sock.sendto(packet, (UDP_IP, UDP_PORT))
-			data, addr = sock.recvfrom(4096)
 
-		except:
-			continue
-		end_time = time.perf_counter()
+async def _probe_root(root):
+    UDP_IP = root[1]
+    packet = query("com", 2)
+    # A = 1 ,NS = 2
+    start_time = time.perf_counter()
+    await send_query(UDP_IP, packet, ROOT_PROBE_DEADLINE, UPSTREAM_PORT)
+    return time.perf_counter() - start_time
 
 
+async def check_nearest_root(deadline=ROOT_PROBE_DEADLINE):
+    """
+    Probe every root concurrently, giving up on stragglers after deadline
+    seconds. Results seed the shared SRTT table, which picks the root for
+    every lookup, and are saved for the next start.
+    """
+    tasks = {asyncio.ensure_future(_probe_root(root)): root for root in root_ips}
+    if not tasks:
+        return
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    for task, root in tasks.items():
+        if task in pending or task.exception() is not None:
+            SERVERS.record_failure(root[1], deadline)
+            continue
+        execution_time = task.result()
+        print(f"{root[0]} Latecy: {execution_time:.4f} seconds")
+        SERVERS.record_rtt(root[1], execution_time)
 
-		execution_time = end_time - start_time
-		print(f"{i[0]} Latecy: {execution_time:.4f} seconds")
+    await asyncio.to_thread(_save_root_state)
 
-		if best["time"] > execution_time:
-			best["value"] = i
-			best["time"] = execution_time
 
-	nearest_root = best["value"]
+def _save_root_state():
+    stats = SERVERS.snapshot()
+    state = {
+        "hints_mtime": os.path.getmtime(ROOT_HINTS),
+        "roots": root_ips,
+        "srtt": {ip: stats[ip]["srtt"] for _, ip in root_ips if ip in stats and stats[ip]["samples"]},
+    }
+    try:
+        os.makedirs(ROOT_STATE_FILE.parent, exist_ok=True)
+        with open(ROOT_STATE_FILE, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+    except OSError as e:
+        print(f"[-] could not save root state: {e}")
 
 
-def read_answer(data, answer_start):
-    i = 0
-    ans = data[answer_start:]
-    val_arr = []
+def _load_root_state():
+    # parsed hints and RTTs from the last run, unless root.hints changed since
+    try:
+        with open(ROOT_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("hints_mtime") != os.path.getmtime(ROOT_HINTS):
+            return False
+        root_ips[:] = [tuple(root) for root in state["roots"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    for ip, srtt in state.get("srtt", {}).items():
+        SERVERS.record_rtt(ip, srtt)
+    return bool(root_ips)
+
+
+def bootstrap():
+    """
+    Load root hints and seed the resolver. Local files only, the root RTT
+    probe runs in the background and never blocks a lookup.
+    """
+    global _bootstrapped, _probe_task
+    if not _bootstrapped:
+        warm = _load_root_state()
+        if not warm:
+            update_root_address()
+        DELEGATIONS.set_roots(root_ips)
+        _bootstrapped = True
+        print(f"[+] resolver ready with {len(root_ips)} roots ({'warm' if warm else 'cold'} start)")
+
+    if _probe_task is None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet, the first lookup starts the probe
+        _probe_task = asyncio.ensure_future(check_nearest_root())
+
+
+def record_value(r):
+    """Text form of a record's data, as stored in the cache."""
+    if r.rtype == TYPE_MX:
+        return f"{r.data[0]} {r.data[1]}"
+    if r.rtype == TYPE_SOA:
+        return " ".join(map(str, r.data))
+    return r.data
+
+
+def read_answer(msg, name, qtype=TYPE_A, zone=""):
+    """
+    Follow name through the CNAMEs in a parsed reply's answer section.
 
-    while i + 12 <= len(ans):  # ensure header fits
-        rtype = int.from_bytes(ans[i+2:i+4], 'big')
-        rclass = int.from_bytes(ans[i+4:i+6], 'big')
-        rttl = int.from_bytes(ans[i+6:i+10], 'big')
-        rdlen = int.from_bytes(ans[i+10:i+12], 'big')
+    Only records inside zone (the bailiwick of the server that sent the
+    reply) are trusted. Returns (value, ttl) pairs of qtype found at the end
+    of the chain, the (owner, target, ttl) CNAME links walked to get there,
+    and the final name.
+    """
+    by_owner = {}
+    for r in msg.answers:
+        owner = normalize(r.name)
+        if in_zone(owner, zone):
+            by_owner.setdefault(owner, []).append(r)
+
+    links = []
+    current = normalize(name)
+    for _ in range(MAX_CNAME_CHAIN):
+        rrs = by_owner.get(current, ())
+        val_arr = [(record_value(r), r.ttl) for r in rrs if r.rtype == qtype and not isinstance(r.data, bytes)]
+        if val_arr:
+            for value, ttl in val_arr:
+                print(f"type={qtype}, ttl={ttl}, value={value}")
+            return val_arr, links, current
+        cname = next((r for r in rrs if r.rtype == TYPE_CNAME), None)
+        if cname is None or qtype == TYPE_CNAME:
+            break
+        target = normalize(cname.data)
+        if any(target == owner for owner, _, _ in links):
+            break  # CNAME loop inside one reply
+        links.append((current, target, cname.ttl))
+        current = target
+    return [], links, current
 
-        rdata = ans[i+12:i+12+rdlen]
 
-        # only process A records (type 1, 4-byte RDATA)
-        if rtype == 1 and rdlen == 4:
-            value = socket.inet_ntoa(rdata)
-            val_arr.append((value, rttl))
-            print(f"type={rtype}, class={rclass}, ttl={rttl}, rdlen={rdlen}, value={value}")
+def negative_soa(msg, name, zone=""):
+    """
+    SOA from the authority section of a reply without the records asked for
+    that is in zone and at or above name, or None. Without one the negative
+    answer must not be cached.
+    """
+    for r in msg.authority:
+        if r.rtype == TYPE_SOA and isinstance(r.data, tuple) and in_zone(r.name, zone) and in_zone(name, r.name):
+            return r
+    return None
 
-        # move to next record
-        i += 12 + rdlen
 
-    return val_arr
+def negative_ttl(soa):
+    """RFC 2308 negative TTL: the smaller of the SOA's own TTL and its MINIMUM field."""
+    return min(soa.ttl, soa.data[6])
 
 
+class NegativeAnswer(list):
+    """
+    Empty lookup result that remembers why: rcode "NXDOMAIN" or "NODATA",
+    its TTL, and the (owner, value) of the zone SOA if there was one.
+    """
 
-def read_addional(packet,data):
-	additonal_ip = []
-	ns_count = int.from_bytes(data[8:10], byteorder="big")
-	# Additional count (ARCOUNT) at bytes 10-11
-	ar_count = int.from_bytes(data[10:12], byteorder="big")
+    def __init__(self, rcode, ttl=0, soa=None):
+        super().__init__()
+        self.rcode = rcode
+        self.ttl = ttl
+        self.soa = soa
 
-	offset = 0
 
-	# print(ns_count)
-	print("ar count:",int(ar_count/2))
-	# print(data)
+def read_referral(msg):
+    """
+    Pull a delegation out of a parsed referral.
 
-	offset += len(packet)
+    Returns (zone, nameserver names, NS ttl, glue) or None when the authority
+    section has no NS records. glue maps a nameserver name to [(ip, ttl)]
+    taken from A records in the additional section.
+    """
+    zone, nameservers, ns_ttl = None, [], None
+    for r in msg.authority:
+        if r.rtype != TYPE_NS:
+            continue
+        owner = normalize(r.name)
+        if zone is None:
+            zone = owner
+        if owner == zone:
+            nameservers.append(normalize(r.data))
+            ns_ttl = r.ttl if ns_ttl is None else min(ns_ttl, r.ttl)
 
-	# authority skip
-	for i in range(ns_count):
-		offset += 2 + 2 + 2 + 4 + 2
-		rdata = int.from_bytes(data[offset-2:offset], byteorder="big")
-		offset += rdata
+    if not nameservers:
+        return None
 
-	# reading additional
-	for i in range(ar_count):
-		offset += 2 # name
-		type = int.from_bytes(data[offset:offset+2], byteorder="big")
-		offset += 2 + 2 + 4 # type,class ,ttl
-		rdata = int.from_bytes(data[offset:offset+2], byteorder="big")
-		offset += 2
-		if type == 1:
-			ip = socket.inet_ntoa(data[offset:offset + rdata])
-			print(ip)
-			additonal_ip.append(ip)
-		offset += rdata
-	return additonal_ip
+    glue = {}
+    for r in msg.additional:
+        owner = normalize(r.name)
+        if r.rtype == TYPE_A and owner in nameservers:
+            glue.setdefault(owner, []).append((r.data, r.ttl))
 
-def decode_dns_name(data, offset):
-    labels = []
-    original_offset = offset
-    jumped = False
+    return zone, nameservers, ns_ttl, glue
 
-    while True:
-        length = data[offset]
 
-        # Pointer detected
-        if (length & 0xC0) == 0xC0:
-            pointer_bytes = data[offset:offset+2]
-            pointer_offset = int.from_bytes(pointer_bytes, 'big') & 0x3FFF
-            if not jumped:
-                original_offset = offset + 2  # next offset after pointer
-            offset = pointer_offset
-            jumped = True
+async def _exchange(server_ips, packet):
+    """
+    Ask servers fastest-first (by SRTT) until one answers, returns the reply
+    or None. Each attempt times out after a multiple of that server's SRTT.
+    """
+    for attempt, server_ip in enumerate(SERVERS.rank(server_ips)):
+        timeout = SERVERS.timeout(server_ip)
+        counters = METRICS.server(server_ip)
+        counters.queries += 1
+        counters.retries += attempt > 0
+        counters.bytes_sent += len(packet)
+        start = time.perf_counter()
+        try:
+            data, addr = await send_query(server_ip, packet, timeout, UPSTREAM_PORT)
+        except asyncio.TimeoutError:
+            SERVERS.record_failure(server_ip, timeout)
+            counters.timeouts += 1
+            print(f"[-] No response from {server_ip} in {timeout:.2f}s, trying next server...")
+            continue
+        except OSError:
+            SERVERS.record_failure(server_ip, timeout)
+            counters.errors += 1
+            print(f"[-] No response from {server_ip}, trying next server...")
             continue
+        SERVERS.record_rtt(server_ip, time.perf_counter() - start)
+        if len(data) > 2 and data[2] & 0x02:
+            # TC bit: the answer didn't fit in UDP, ask again over TCP
+            print(f"[+] truncated reply from {server_ip}, retrying over TCP")
+            counters.tcp += 1
+            counters.bytes_received += len(data)
+            counters.bytes_sent += len(packet)
+            try:
+                data, addr = await send_query_tcp(server_ip, packet, port=UPSTREAM_PORT)
+            except (asyncio.TimeoutError, OSError):
+                # the server did answer over UDP, so no SRTT penalty for it
+                counters.tcp_errors += 1
+                print(f"[-] TCP retry to {server_ip} failed, trying next server...")
+                continue
+        counters.bytes_received += len(data)
+        print(f"[+] response from {addr}")
+        return data
+    return None
+
+
+async def _nameserver_ips(delegation, depth):
+    ips = delegation.server_ips()
+    if ips:
+        return ips  # _exchange() orders them by SRTT
+
+    # glueless delegation: look up the nameserver addresses ourselves
+    for ns_name in random.sample(delegation.nameservers, len(delegation.nameservers)):
+        if in_zone(ns_name, delegation.zone):
+            continue  # can't be found without the glue we didn't get
+        print("[+] finding ip of nameserver " + ns_name)
+        addrs = await lookup_address(ns_name, depth + 1)
+        if addrs:
+            delegation.add_addresses(ns_name, [ip for ip, _ in addrs], min(ttl for _, ttl in addrs))
+            return delegation.server_ips()
+    return []
+
+
+async def lookup_address(name, depth=0):
+    """A records for a nameserver name, from cache or a nested lookup."""
+    result, _ = await lookup(name, "A", depth=depth)
+    return result
 
-        # End of name
-        if length == 0:
-            offset += 1
-            if not jumped:
-                original_offset = offset
-            break
 
-        # Normal label
-        offset += 1
-        labels.append(data[offset:offset+length].decode("ascii"))
-        offset += length
+async def iterate(domain, qtype=TYPE_A, depth=0):
+    """
+    Walk zone cuts from the closest cached delegation down to the server
+    that can answer for domain. Every referral on the way is cached.
 
-    return ".".join(labels), original_offset
+    Returns (parsed final reply, zone of the server that sent it), or None
+    if resolution failed.
+    """
+    if _probe_task is None:
+        bootstrap()
+    delegation = DELEGATIONS.closest(domain)
+    for _ in range(MAX_REFERRALS):
+        zone_label = delegation.zone or "."
+        server_ips = await _nameserver_ips(delegation, depth)
+        if not server_ips:
+            print(f"[-] no reachable nameservers for zone '{zone_label}'")
+            return None
+
+        print(f"[+] asking '{zone_label}' servers about {domain}")
+        packet = query(domain, qtype, use_edns=True)
+        stage = stage_for(delegation.zone)
+        hop_start = time.perf_counter()
+        data = await _exchange(server_ips, packet)
+        hop_time = time.perf_counter() - hop_start
+        METRICS.stages[stage].record(hop_time)
+        stage_times = _stage_times.get()
+        if stage_times is not None:
+            stage_times[stage] += hop_time
+        if data is None:
+            print(f"[-] All servers for '{zone_label}' failed.")
+            return None
+
+        try:
+            msg = parse_message(data)
+        except ParseError as e:
+            print(f"[-] malformed reply from '{zone_label}' servers: {e}")
+            return None
+        if msg.answers:
+            return msg, delegation.zone
+
+        referral = read_referral(msg)
+        if referral is None:
+            return msg, delegation.zone  # authoritative answer without the records we asked for
+        zone, nameservers, ttl, glue = referral
+        if zone == delegation.zone or not in_zone(zone, delegation.zone) or not in_zone(domain, zone):
+            print(f"[-] ignoring bad referral to '{zone}' from '{zone_label}'")
+            return None
+        print(f"[+] referral to '{zone}' ({len(nameservers)} NS, {len(glue)} glued)")
+        delegation = DELEGATIONS.put(zone, nameservers, ttl, glue)
+
+    print(f"[-] too many referrals while resolving {domain}")
+    return None
+
+
+async def lookup(domain, rtype="A", rclass="IN", depth=0):
+    """
+    Resolve domain to records of rtype, following CNAME chains.
 
-def read_authority(packet, data):
-    authority_ip = []
-    ns_count = int.from_bytes(data[8:10], "big")
-    offset = len(packet)
+    Every CNAME link is cached on its own under (owner, "CNAME"), and the
+    final records under (last name in the chain, rtype), so a later lookup
+    that lands on a name we already know stops there.
 
-    for i in range(ns_count):
-        # Decode NAME first (handles pointers)
-        name, name_end = decode_dns_name(data, offset)
+    Returns (list of (value, ttl), answered entirely from cache). The list
+    is an empty NegativeAnswer when the name (NXDOMAIN) or the records
+    (NODATA) do not exist and None when resolution failed. Negative answers
+    are cached for their RFC 2308 TTL like any other set.
 
-        # TYPE (2), CLASS (2), TTL (4), RDLENGTH (2)
-        rdata_len = int.from_bytes(data[name_end+8:name_end+10], "big")
-        rdata_offset = name_end + 10
+    Cache misses for the same (name, type, class) that overlap in time are
+    coalesced, so a burst of identical queries (or many glueless referrals
+    to the same nameserver) walks the hierarchy once.
 
-        # Decode NS RDATA (could have pointers)
-        ns_name, _ = decode_dns_name(data, rdata_offset)
-        print(f"NS record {i+1}: {ns_name}")
-
-        offset = rdata_offset + rdata_len
-        authority_ip.append(ns_name)
-
-
-    return authority_ip
-
-
-def root_server(root_ip,domain):
-	print(f"[+] contacting root server {root_ip[0]}")
-	UDP_IP = root_ip[1]
-	UDP_PORT = 53
-	add = (UDP_IP, UDP_PORT)
-	packet = query(domain,2)
-	
-
-	# A = 1 ,NS = 2
-	addr = sock.sendto(packet, (UDP_IP, UDP_PORT))
-	data, addr = sock.recvfrom(4096)
-
-	print(f"[+] response from {addr}")
-	print(data)
-	tld_ips = read_addional(packet,data)
-
-	return tld_ips
-
-def find_answer_start(data):
-    # skip 12-byte header
-    offset = 12
-    # skip the question name (variable length)
-    while data[offset] != 0:
-        offset += data[offset] + 1
-    # skip null terminator + QTYPE(2 bytes) + QCLASS(2 bytes)
-    offset += 5
-    return offset
-
-
-def nameserver(name_ips,domain):
-
-	if isinstance(name_ips, tuple):
-		name_ips = [name_ips]
-
-	if not name_ips:
-		print("[-] No nameserver IPs to query. Exiting.")
-		return None
-
-	choice = random.choice(name_ips)
-
-	name_ip = choice[0] if isinstance(choice, tuple) else choice
-
-    # Remove it safely
-	name_ips = [x for x in name_ips if (x[0] if isinstance(x, tuple) else x) != name_ip]
-
-	print(f"[+] contacting name server ",name_ip)
-	print("DOOOOINGGGGGGGGGGGGGGGGGG")
-	UDP_IP = name_ip
-	UDP_PORT = 53
-	add = (UDP_IP, UDP_PORT)
-	packet = query(domain, 1, use_edns=True)
-
-	print(packet)
-	try:
-		addr = sock.sendto(packet, (UDP_IP, UDP_PORT))
-		data, addr = sock.recvfrom(4096)
-
-		print(f"[+] response from {addr}")
-		print(data)
-	except socket.timeout:
-		print(f"[-] No response from nameserver {name_ip}, trying next server...")
-		if name_ips:  # make sure there are servers left
-			return nameserver(name_ips,domain)
-		else:
-			print("[-] All Bopm bom servers failed.")
-			return None
-
-	# print(data)
-	answer_start = find_answer_start(data)
-	return read_answer(data, answer_start)
-
-
-def NS_TO_IP(packet,data):
-	nameserver_ns = random.choice(read_authority(packet,data))
-	print("[+] finding ip of nameserver "+nameserver_ns)
-	mg = root_server(nearest_root,nameserver_ns)
-	print(mg)
-	nameserver_tld = tld_server(mg,nameserver_ns)
-	print("Found namerserver NS -- namerserver Ip")
-	print(nameserver_tld)
-	namer_ip = nameserver(nameserver_tld,nameserver_ns)
-	return [namer_ip[0]]
-
-
-def tld_server(tld_ips,domain,recursive=0):
-	tld_ip = random.choice(tld_ips)
-	tld_ips.remove(tld_ip)
-	print(f"[+] contacting tld server ",tld_ip)
-	UDP_IP = tld_ip
-	UDP_PORT = 53
-	add = (UDP_IP, UDP_PORT)
-	packet = query(domain,2)
-	print(packet)
-	# data = ''
-	try:
-		addr = sock.sendto(packet, (UDP_IP, UDP_PORT))
-		data, addr = sock.recvfrom(4096)
-	
-		print(f"[+] response from {addr}")
-	except socket.timeout:
-	    print(f"[-] No response from {tld_ip}, trying next server...")
-	    if tld_ips:  # make sure there are servers left
-	        return tld_server(tld_ips, domain, 1)
-	    else:
-	        print("[-] All TLD servers failed.")
-	        return None
-
-	print("Tld server response data :-")
-	print(data)
-	glued_ip = read_addional(packet,data)
-	if glued_ip:
-		print("[+] Found glued ip")
-		return glued_ip
-
-	ok = NS_TO_IP(packet,data)
-	return ok
-
-
-
-update_root_address()
-check_nearest_root()
+    If an expired copy is still within the stale window, it is returned when
+    resolution fails, or (for top-level lookups) when it takes longer than
+    STALE_ANSWER_DEADLINE; the resolution keeps running and refreshes the
+    cache for the next caller.
+    """
+    rtype = rtype.upper()
+    name = normalize(domain)
+    cached = get_records(name, rtype, rclass)
+    if cached:
+        return _cache_hit(name, rtype, rclass, cached), True
+    negative = get_negative(name, rtype, rclass)
+    if negative:
+        return NegativeAnswer(*negative), True
+
+    fresh = _shared((name, rtype, rclass.upper()), lambda: _lookup(name, rtype, rclass, depth))
+    stale = _stale_chain(name, rtype, rclass)
+    if not stale:
+        return await fresh
+
+    task = _spawn(fresh)
+    done, _ = await asyncio.wait({task}, timeout=STALE_ANSWER_DEADLINE if depth == 0 else None)
+    if done and not task.exception() and task.result()[0] is not None:
+        return task.result()
+    reason = "resolution failed" if done else f"no answer within {STALE_ANSWER_DEADLINE}s"
+    print(f"[-] {reason} for {name} {rtype}, serving stale records")
+    return [(r["value"], r["ttl"]) for r in stale], True
+
+
+def _stale_chain(name, rtype, rclass):
+    """
+    Stale records for name, following cached CNAME links (live or stale)
+    the way _lookup() follows live ones, since the final set of an alias
+    is stored under the end of its chain. [] if any link is missing.
+    """
+    seen = {name}
+    for _ in range(MAX_CNAME_CHAIN + 1):
+        records = get_stale(name, rtype, rclass)
+        if records or rtype == "CNAME":
+            return records
+        link = get_records(name, "CNAME", rclass) or get_stale(name, "CNAME", rclass)
+        if not link:
+            return []
+        name = normalize(link[0]["value"])
+        if name in seen:
+            return []
+        seen.add(name)
+    return []
+
+
+async def _shared(key, factory):
+    """
+    IN_FLIGHT.do() that also hands the flight's hop times to every caller.
+    The flight task starts with a copy of the first caller's context, so
+    it times its hops into a dict of its own and each caller, leader or
+    coalesced waiter, adds those to its resolve() breakdown.
+    """
+    async def timed():
+        times = {stage: 0.0 for stage in METRICS.stages}
+        token = _stage_times.set(times)
+        try:
+            return await factory(), times
+        finally:
+            _stage_times.reset(token)
+
+    result, times = await IN_FLIGHT.do(key, timed)
+    mine = _stage_times.get()
+    if mine is not None:
+        for stage, seconds in times.items():
+            mine[stage] += seconds
+    return result
+
+
+def _spawn(coro):
+    """Run coro as a background task that is kept referenced until it finishes."""
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def _cache_hit(name, rtype, rclass, cached):
+    """Count the hit and, for popular sets near expiry, start a background refresh."""
+    print("sending from cache", cached)
+    key = (name, rtype, rclass.upper())
+    score = POPULARITY.hit(key)
+    if score >= PREFETCH_MIN_SCORE and needs_refresh(cached) and key not in IN_FLIGHT.keys():
+        print(f"[+] prefetching {name} {rtype} (score {score:.1f}, ttl {min(r['ttl'] for r in cached)}s left)")
+        _spawn(_shared(key, lambda: _lookup(name, rtype, rclass, 0, refresh=True)))
+    return [(r["value"], r["ttl"]) for r in cached]
+
+
+async def _lookup(domain, rtype, rclass, depth, refresh=False):
+    """lookup() without the coalescing; refresh=True ignores what is cached for domain itself."""
+    qtype = TYPE_CODES[rtype]
+    if depth > MAX_GLUELESS_DEPTH:
+        print(f"[-] giving up on {domain}, too many nested lookups")
+        return None, False
+
+    name = normalize(domain)
+    seen = {name}
+    from_cache = not refresh
+    for _ in range(MAX_CNAME_CHAIN + 1):
+        skip_cache = refresh and name == normalize(domain)
+        cached = None if skip_cache else get_records(name, rtype, rclass)
+        if cached:
+            return _cache_hit(name, rtype, rclass, cached), from_cache
+        negative = None if skip_cache else get_negative(name, rtype, rclass)
+        if negative:
+            return NegativeAnswer(*negative), from_cache
+
+        target = None
+        if rtype != "CNAME" and not skip_cache:
+            link = get_records(name, "CNAME", rclass)
+            if link:
+                target = normalize(link[0]["value"])
+
+        if target is None:
+            from_cache = False
+            answer = await iterate(name, qtype, depth)
+            if answer is None:
+                return None, False
+            msg, zone = answer
+            if msg.header.rcode not in (0, 3):
+                print(f"[-] {RCODE_NAMES.get(msg.header.rcode, msg.header.rcode)} from '{zone or '.'}' servers for {name}")
+                return None, False
+            records, links, final = read_answer(msg, name, qtype, zone)
+            for owner, link_target, ttl in links:
+                set_records(owner, [(link_target, ttl)], "CNAME", rclass)
+            if records:
+                set_records(final, records, rtype, rclass)
+                return records, False
+
+            # no records: the reply is negative for the last name of the chain,
+            # if that name is one the server is authoritative for
+            rcode = "NXDOMAIN" if msg.header.rcode == 3 else "NODATA"
+            soa = negative_soa(msg, final, zone) if in_zone(final, zone) else None
+            ttl = negative_ttl(soa) if soa is not None else None
+            soa = (normalize(soa.name), record_value(soa)) if soa is not None else None
+            if ttl is not None:
+                set_negative(final, rtype, rcode, ttl, rclass, soa)
+            if not links:
+                return NegativeAnswer(rcode, ttl or 0, soa), False
+            target = final
+
+        print(f"[+] {name} is an alias for {target}")
+        if target in seen:
+            print(f"[-] CNAME loop at {target}")
+            return None, False
+        seen.add(target)
+        name = target
+
+    print(f"[-] CNAME chain for {domain} is longer than {MAX_CNAME_CHAIN}")
+    return None, False
 
 
-import json
 import uuid
 from datetime import datetime
 
-def resolver(domain, rtype="A", rclass="IN", client_ip="unknown"):
+from utils.dns.querylog import QUERY_LOG
+from utils.dns.analytics import ANALYTICS
+
+async def resolve(domain, rtype="A", rclass="IN", client_ip="unknown", protocol="UDP"):
     """
-    Resolver function with JSON logging for frontend dashboard.
+    Iterative root -> TLD -> authoritative resolution on the running event loop,
+    with JSON Lines logging for frontend dashboard.
     
     Args:
         domain (str): Domain to resolve
-        rtype (str): Record type (default: "A")
+        rtype (str): Record type, one of SUPPORTED_TYPES (default: "A")
         rclass (str): Record class (default: "IN")  
         client_ip (str): Client IP address (default: "unknown")
+        protocol (str): Transport the client used, for the log (default: "UDP")
     """
+    rtype = rtype.upper()
+    if rtype not in SUPPORTED_TYPES:
+        raise ValueError(f"unsupported record type {rtype}")
     start_time = time.perf_counter()
-    purge_expired()
+    stage_times = {stage: 0.0 for stage in METRICS.stages}
+    _stage_times.set(stage_times)
 
-    cached = get_records(domain, rtype, rclass)
-    is_cached = bool(cached)
-    
-    if cached:
-        print("sending from cache", cached)
-        result = list(map(lambda x: (x["value"], x["ttl"]), cached))
-    else:
-        print("root --> tld")
-        root_res = root_server(nearest_root, domain)
-        print("Main query Tld :-", root_res)
-
-        print("tld --> nameserver NS")
-        tld = tld_server(root_res, domain, 1)
-
-        print("nameserver Ip ---> Domain IP")
-        result = nameserver(tld, domain)
-        
-        if result:
-            set_records(domain, result, rtype, rclass)
+    result, is_cached = await lookup(domain, rtype, rclass)
 
     end_time = time.perf_counter()
+    METRICS.resolve.record(end_time - start_time)
     latency_ms = int((end_time - start_time) * 1000)
     
     # Determine rcode
-    rcode = "NOERROR"
-    if not result:
-        rcode = "NXDOMAIN" if not cached else "NOERROR"
+    rcode = "NOERROR"  # NODATA is NOERROR with no records
+    if result is None:
+        rcode = "SERVFAIL"
+    elif getattr(result, "rcode", None) == "NXDOMAIN":
+        rcode = "NXDOMAIN"
     
     # Generate unique request ID
     req_id = f"req_{str(uuid.uuid4())[:8]}"
@@ -413,28 +669,77 @@ def resolver(domain, rtype="A", rclass="IN", client_ip="unknown"):
         "query_type": rtype,
         "rcode": rcode,
         "latency_ms": latency_ms,
-        "protocol": "UDP",
+        "stages_ms": {stage: round(t * 1000, 2) for stage, t in stage_times.items()},
+        "protocol": protocol,
         "cached": is_cached
     }
     
-    # Load existing logs or create empty list
-    try:
-        with open("dns_queries.json", "r") as f:
-            logs = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        logs = []
+    # Queued only, the background writer appends it to dns_queries.jsonl
+    QUERY_LOG.record(log_entry)
+    ANALYTICS.record(domain, rcode, (end_time - start_time) * 1000, is_cached)
     
-    # Append new entry
-    logs.append(log_entry)
-    
-    # Keep only last 1000 entries to prevent file bloat
-    if len(logs) > 1000:
-        logs = logs[-1000:]
-    
-    # Save back to JSON
-    with open("dns_queries.json", "w") as f:
-        json.dump(logs, f, indent=2)
-    
-    print(f"[LOG] Saved query log: {req_id} for {domain} (cached: {is_cached}, latency: {latency_ms}ms)")
+    print(f"[LOG] Queued query log: {req_id} for {domain} (cached: {is_cached}, latency: {latency_ms}ms)")
     
     return result
+
+
+def stats() -> dict:
+    """
+    Runtime view of the resolver: hop and resolve() latency histograms,
+    upstream server counters, cache tier hits and misses, and how many
+    lookups were coalesced onto another caller's resolution.
+    """
+    snapshot = METRICS.snapshot()
+    snapshot["cache"] = cache_stats()
+    snapshot["coalescing"] = {"flights": IN_FLIGHT.started, "waiters": IN_FLIGHT.coalesced, "in_flight": len(IN_FLIGHT)}
+    return snapshot
+
+
+def resolver(domain, rtype="A", rclass="IN", client_ip="unknown"):
+    """Blocking wrapper around resolve() for scripts and the REPL.
+
+    Do not call this from a coroutine, await resolve() instead.
+    """
+    try:
+        return asyncio.run(_resolve_once(domain, rtype, rclass, client_ip))
+    finally:
+        QUERY_LOG.flush()
+
+
+async def _resolve_once(domain, rtype, rclass, client_ip):
+    # the multiplexer and TCP pool belong to this loop only, so close their
+    # sockets before asyncio.run() throws the loop away
+    try:
+        return await resolve(domain, rtype, rclass, client_ip)
+    finally:
+        get_multiplexer().close()
+        get_tcp_pool().close()
+
+
+async def resolve_many(queries, rclass="IN", client_ip="unknown", concurrency=BATCH_CONCURRENCY):
+    """
+    Resolve a batch of (domain, rtype) pairs concurrently through resolve().
+
+    Duplicates (case and trailing dot insensitive) are resolved once. At most
+    concurrency lookups are in flight at a time, so a batch costs about as much
+    as its slowest lookup instead of the sum of all of them.
+
+    Returns a list of (domain, rtype, records or exception) in first-seen order.
+    """
+    unique = {}
+    for domain, rtype in queries:
+        key = (normalize(domain), rtype.upper())
+        if key[0] and key not in unique:
+            unique[key] = domain.strip().rstrip(".")
+
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(domain, rtype):
+        async with gate:
+            try:
+                return await resolve(domain, rtype, rclass, client_ip)
+            except Exception as e:
+                return e
+
+    results = await asyncio.gather(*(one(domain, rtype) for (_, rtype), domain in unique.items()))
+    return [(domain, rtype, result) for ((_, rtype), domain), result in zip(unique.items(), results)]
@@ -0,0 +1,114 @@
+# metrics.py
+import bisect
+
+
+# histogram bucket upper bounds in seconds: 50 us up to ~30 s, each 1.5x the previous
+BUCKETS = [0.00005 * 1.5 ** i for i in range(34)]
+STAGES = ("root", "tld", "auth")
+
+
+def stage_for(zone: str) -> str:
+    """Which hop a query to the servers of zone is: root, TLD or authoritative."""
+    if not zone:
+        return "root"
+    return "tld" if "." not in zone else "auth"
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. record() is a bisect and an increment,
+    quantiles are read off the cumulative counts (accurate to one bucket,
+    i.e. within 50%).
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot: above the largest bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        """count, mean and p50/p95/p99/max, times in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class ServerCounters:
+    __slots__ = ("queries", "retries", "timeouts", "errors", "tcp", "tcp_errors", "bytes_sent", "bytes_received")
+
+    def __init__(self):
+        self.queries = 0
+        self.retries = 0          # queries sent after another server for the same hop failed
+        self.timeouts = 0
+        self.errors = 0           # socket errors
+        self.tcp = 0              # truncated replies retried over TCP
+        self.tcp_errors = 0       # of those, TCP retries that failed
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ResolverMetrics:
+    """
+    Aggregated timings of every resolution since start (or reset()):
+    one histogram per hop type, one for whole resolve() calls, and per
+    upstream server counters.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.resolve = Histogram()
+        self.servers: dict[str, ServerCounters] = {}
+
+    def server(self, ip: str) -> ServerCounters:
+        counters = self.servers.get(ip)
+        if counters is None:
+            counters = self.servers[ip] = ServerCounters()
+        return counters
+
+    def snapshot(self, top_servers: int = 10) -> dict:
+        servers = sorted(self.servers.items(), key=lambda item: -item[1].queries)
+        totals = ServerCounters()
+        for _, counters in servers:
+            for name in ServerCounters.__slots__:
+                setattr(totals, name, getattr(totals, name) + getattr(counters, name))
+        return {
+            "resolve": self.resolve.summary(),
+            "stages": {stage: hist.summary() for stage, hist in self.stages.items()},
+            "upstream": totals.as_dict(),
+            "servers": {ip: counters.as_dict() for ip, counters in servers[:top_servers]},
+        }
+
+
+METRICS = ResolverMetrics()
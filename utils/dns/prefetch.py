@@ -0,0 +1,63 @@
+# prefetch.py
+import math
+import time
+from collections import OrderedDict
+
+
+HIT_HALF_LIFE = 600.0      # seconds for a key's hit score to halve without new hits
+PREFETCH_MIN_SCORE = 4.0   # decayed hits a key needs before it is refreshed ahead of expiry
+PREFETCH_WINDOW = 0.1      # refresh once less than this fraction of the TTL is left
+PREFETCH_MIN_TTL = 10      # sets with a shorter original TTL are never prefetched
+MAX_TRACKED = 10000
+
+
+class HitCounter:
+    """
+    Exponentially decaying hit count per cache key. Each hit adds 1 and the
+    score halves every half_life seconds, so a name queried in a burst an
+    hour ago stops counting as popular. Bounded LRU, the least recently hit
+    keys are forgotten first.
+    """
+
+    def __init__(self, half_life: float = HIT_HALF_LIFE, max_keys: int = MAX_TRACKED):
+        self.rate = math.log(2) / half_life
+        self.max_keys = max_keys
+        self._scores: "OrderedDict[tuple, tuple[float, float]]" = OrderedDict()  # key -> (score, last hit)
+
+    def hit(self, key, now: float | None = None) -> float:
+        """Count a hit, returns the key's decayed score including it."""
+        now = time.time() if now is None else now
+        score, last = self._scores.get(key, (0.0, now))
+        score = score * math.exp(-self.rate * (now - last)) + 1
+        self._scores[key] = (score, now)
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.max_keys:
+            self._scores.popitem(last=False)
+        return score
+
+    def score(self, key, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        score, last = self._scores.get(key, (0.0, now))
+        return score * math.exp(-self.rate * (now - last))
+
+    def top(self, n: int = 10) -> list:
+        """[(key, score)] for the n highest decayed scores."""
+        now = time.time()
+        return sorted(((k, self.score(k, now)) for k in self._scores), key=lambda x: -x[1])[:n]
+
+    def __len__(self):
+        return len(self._scores)
+
+
+def needs_refresh(records: list) -> bool:
+    """
+    records are live cache entries ({"value", "ttl", "orig_ttl"}). True once
+    the set as a whole is inside the last PREFETCH_WINDOW of its lifetime.
+    """
+    if not records:
+        return False
+    soonest = min(records, key=lambda r: r["ttl"])
+    orig_ttl = soonest.get("orig_ttl", 0)
+    if orig_ttl < PREFETCH_MIN_TTL:
+        return False
+    return soonest["ttl"] <= orig_ttl * PREFETCH_WINDOW
@@ -0,0 +1,62 @@
+# querylog.py
+import os
+import json
+import threading
+from collections import deque
+
+
+LOG_PATH = "dns_queries.jsonl"   # one JSON object per line, read by the dashboard
+MAX_BYTES = 5 * 1024 * 1024      # rotate to dns_queries.jsonl.1 past this size
+BACKUPS = 3                      # rotated files kept (.1 newest ... .3 oldest)
+MAX_PENDING = 10000              # entries held in memory if the writer falls behind
+FLUSH_INTERVAL = 2               # seconds between background flushes
+
+
+class QueryLog:
+    """
+    Append-only query log. record() only queues the entry in memory, a
+    background task calls flush() to write everything queued since the last
+    flush in one append, rotating the file by size.
+    """
+
+    def __init__(self, path: str = LOG_PATH, max_bytes: int = MAX_BYTES, backups: int = BACKUPS,
+                 max_pending: int = MAX_PENDING):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # bounded: under sustained overload the oldest unwritten entries are dropped
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()  # flush() may run in a worker thread
+
+    def record(self, entry: dict):
+        self._pending.append(entry)
+
+    def flush(self) -> int:
+        """Write all queued entries, returns how many were written."""
+        with self._lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return 0
+            data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in batch)
+            self._rotate_if_needed(len(data))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+        return len(batch)
+
+    def _rotate_if_needed(self, incoming: int):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+QUERY_LOG = QueryLog()
@@ -0,0 +1,209 @@
+# server.py
+"""
+Standalone caching recursive DNS server on top of the bot's resolver.
+
+    python -m utils.dns.server --host 127.0.0.1 --port 5353
+
+Answers standard queries over UDP and TCP with the same engine and LMDB
+cache as /dns, so other services on the host share the bot's warm cache.
+Only listen on addresses you trust: there is no access control.
+"""
+import os
+import struct
+import asyncio
+import argparse
+
+from utils.dns import main as resolver
+from utils.dns.cache import get_records, purge_expired, SWEEP_INTERVAL, SWEEP_BATCH
+from utils.dns.querylog import QUERY_LOG, FLUSH_INTERVAL
+from utils.dns.wire import parse_message, build_reply, ParseError, TYPE_NAMES, TYPE_CNAME, TYPE_SOA, TYPE_OPT
+
+
+DEFAULT_HOST = os.getenv("DNS_SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("DNS_SERVER_PORT", "5353"))
+MAX_PENDING = 2000       # queries being resolved at once; past this new ones get SERVFAIL
+TCP_IDLE_TIMEOUT = 10    # seconds an idle TCP client connection is kept (RFC 7766)
+CLASS_IN = 1
+
+FORMERR, SERVFAIL, NXDOMAIN, NOTIMP = 1, 2, 3, 4
+
+
+class DNSServer:
+    """Turns raw queries into raw replies; UDP and TCP front ends share it."""
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.answered = 0
+
+    async def handle(self, data: bytes, client_ip: str, tcp: bool = False) -> bytes | None:
+        try:
+            msg = parse_message(data)
+        except ParseError:
+            return None  # not even a header we could answer to
+        flags = msg.header.flags
+        if flags & 0x8000 or not msg.questions:
+            return None  # a response, or nothing to echo back
+        if len(msg.questions) > 1:
+            return build_reply(msg, FORMERR)
+
+        edns = next((r for r in msg.additional if r.rtype == TYPE_OPT), None)
+        max_size = None if tcp else max(512, edns.rclass) if edns else 512
+
+        def reply(rcode, answers=(), authority=()):
+            return build_reply(msg, rcode, answers, max_size=max_size, edns=edns is not None, authority=authority)
+
+        question = msg.questions[0]
+        rtype = TYPE_NAMES.get(question.qtype)
+        if (flags >> 11) & 0xF or question.qclass != CLASS_IN:
+            return reply(NOTIMP)
+        if rtype not in resolver.SUPPORTED_TYPES:
+            return reply(NOTIMP)
+        if self.pending >= self.max_pending:
+            return reply(SERVFAIL)
+
+        self.pending += 1
+        try:
+            result = await resolver.resolve(question.name, rtype, client_ip=client_ip,
+                                            protocol="TCP" if tcp else "UDP")
+        except Exception as e:
+            print(f"[-] dns server failed on {question.name} {rtype}: {e}")
+            result = None
+        finally:
+            self.pending -= 1
+        self.answered += 1
+
+        if result is None:
+            return reply(SERVFAIL)
+        answers, final = self._cname_chain(question.name, rtype)
+        if not result:
+            # RFC 2308 section 3: the zone SOA, with the remaining negative TTL,
+            # lets downstream caches cache the negative answer too
+            soa = getattr(result, "soa", None)
+            authority = [(soa[0], TYPE_SOA, result.ttl, soa[1])] if soa else []
+            return reply(NXDOMAIN if getattr(result, "rcode", None) == "NXDOMAIN" else 0, answers, authority)
+        answers += [(final, question.qtype, ttl, value) for value, ttl in result]
+        return reply(0, answers)
+
+    @staticmethod
+    def _cname_chain(name: str, rtype: str):
+        """CNAME records from name to the end of its cached chain, and that end."""
+        answers = []
+        current = resolver.normalize(name)
+        if rtype == "CNAME":
+            return answers, current
+        for _ in range(resolver.MAX_CNAME_CHAIN):
+            link = get_records(current, "CNAME")
+            if not link:
+                break
+            target = resolver.normalize(link[0]["value"])
+            answers.append((current, TYPE_CNAME, link[0]["ttl"], target))
+            current = target
+        return answers, current
+
+
+class UDPServer(asyncio.DatagramProtocol):
+    def __init__(self, server: DNSServer):
+        self.server = server
+        self.transport = None
+        self._tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.ensure_future(self._answer(data, addr))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _answer(self, data, addr):
+        try:
+            reply = await self.server.handle(data, addr[0])
+        except Exception as e:
+            print(f"[-] dns server could not answer {addr[0]}: {e}")
+            return
+        if reply is not None and not self.transport.is_closing():
+            self.transport.sendto(reply, addr)
+
+
+async def serve_tcp_client(server: DNSServer, reader, writer):
+    # queries on one connection are answered concurrently and may be answered out of order
+    client_ip = writer.get_extra_info("peername")[0]
+    tasks = set()
+
+    async def answer(data):
+        try:
+            reply = await server.handle(data, client_ip, tcp=True)
+        except Exception as e:
+            print(f"[-] dns server could not answer {client_ip}: {e}")
+            return
+        if reply is not None and not writer.is_closing():
+            writer.write(struct.pack(">H", len(reply)) + reply)
+
+    try:
+        while True:
+            length = struct.unpack(">H", await asyncio.wait_for(reader.readexactly(2), TCP_IDLE_TIMEOUT))[0]
+            task = asyncio.ensure_future(answer(await reader.readexactly(length)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+
+
+async def _periodic(interval, job):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception as e:
+            print(f"[-] background job failed: {e}")
+
+
+async def _sweep():
+    while purge_expired(limit=SWEEP_BATCH) >= SWEEP_BATCH:
+        await asyncio.sleep(0)
+
+
+async def _flush_log():
+    await asyncio.to_thread(QUERY_LOG.flush)
+
+
+async def run(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    loop = asyncio.get_running_loop()
+    server = DNSServer()
+    resolver.bootstrap()
+
+    udp, _ = await loop.create_datagram_endpoint(lambda: UDPServer(server), local_addr=(host, port))
+    tcp = await asyncio.start_server(lambda r, w: serve_tcp_client(server, r, w), host, port)
+    background = [
+        asyncio.ensure_future(_periodic(SWEEP_INTERVAL, _sweep)),
+        asyncio.ensure_future(_periodic(FLUSH_INTERVAL, _flush_log)),
+    ]
+    print(f"[+] dns server listening on {host}:{port} (udp+tcp)")
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        udp.close()
+        for task in background:
+            task.cancel()
+        QUERY_LOG.flush()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Caching recursive DNS server using the bot's resolver.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"UDP and TCP port (default {DEFAULT_PORT})")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,81 @@
+# singleflight.py
+import asyncio
+import contextvars
+
+
+class _Flight:
+    __slots__ = ("task", "waiting_on")
+
+    def __init__(self):
+        self.task = None
+        self.waiting_on = None  # flight this one's task is currently blocked on
+
+
+# flight whose task is running the current coroutine, if any
+_current: contextvars.ContextVar = contextvars.ContextVar("dns_singleflight_current", default=None)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work onto one task. The first caller for a
+    key starts it, everyone else arriving before it finishes awaits the same
+    result (or exception).
+
+    Nested lookups can depend on each other (glueless delegations whose
+    nameservers live in each other's zones), so before waiting on a flight we
+    walk what it is itself waiting on; if that leads back to the caller's own
+    flight, the caller runs the work directly instead of deadlocking.
+    """
+
+    def __init__(self):
+        self._flights: dict = {}
+        self.started = 0
+        self.coalesced = 0  # callers that shared another caller's result
+
+    def __len__(self):
+        return len(self._flights)
+
+    def keys(self):
+        return self._flights.keys()
+
+    async def do(self, key, factory):
+        """factory() returns the coroutine to run if no flight for key exists."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return await self._start(key, factory)
+
+        me = _current.get()
+        other = flight
+        while other is not None:
+            if other is me:
+                return await factory()
+            other = other.waiting_on
+
+        self.coalesced += 1
+        return await self._wait(flight, me)
+
+    async def _start(self, key, factory):
+        flight = _Flight()
+
+        async def run():
+            _current.set(flight)
+            try:
+                return await factory()
+            finally:
+                self._flights.pop(key, None)
+
+        self.started += 1
+        self._flights[key] = flight
+        flight.task = asyncio.ensure_future(run())
+        return await self._wait(flight, _current.get())
+
+    @staticmethod
+    async def _wait(flight, me):
+        if me is not None:
+            me.waiting_on = flight
+        try:
+            # shielded: a cancelled waiter must not cancel the shared lookup
+            return await asyncio.shield(flight.task)
+        finally:
+            if me is not None:
+                me.waiting_on = None
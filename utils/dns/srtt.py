@@ -0,0 +1,75 @@
+# srtt.py
+import random
+
+
+SRTT_WEIGHT = 0.3          # weight of a new RTT sample in the smoothed value
+INITIAL_SRTT_MAX = 0.032   # unmeasured servers start at a random 0-32 ms, so each gets tried early
+EXPLORE_DECAY = 0.98       # servers passed over get a little "faster" each time, so slow ones are re-probed
+MAX_SRTT = 10.0
+TIMEOUT_FACTOR = 3         # a dead server costs about TIMEOUT_FACTOR x SRTT
+MIN_TIMEOUT = 0.15
+MAX_TIMEOUT = 2.0
+
+
+class ServerStats:
+    __slots__ = ("srtt", "samples", "failures")
+
+    def __init__(self, srtt: float):
+        self.srtt = srtt
+        self.samples = 0
+        self.failures = 0
+
+
+class ServerSelector:
+    """
+    Per-address smoothed RTT and failure tracking shared by every hop (root,
+    TLD and authoritative), in the spirit of BIND's SRTT.
+
+    rank() puts the fastest healthy servers first and decays the SRTT of the
+    ones it passed over, so a server that was slow once is tried again after
+    a while. timeout() derives each query's timeout from the server's SRTT.
+    """
+
+    def __init__(self):
+        self._stats: dict[str, ServerStats] = {}
+
+    def _get(self, ip: str) -> ServerStats:
+        stats = self._stats.get(ip)
+        if stats is None:
+            stats = self._stats[ip] = ServerStats(random.uniform(0, INITIAL_SRTT_MAX))
+        return stats
+
+    def rank(self, ips: list) -> list:
+        """Candidates ordered best first."""
+        ranked = sorted(ips, key=lambda ip: self._get(ip).srtt)
+        for ip in ranked[1:]:
+            self._stats[ip].srtt *= EXPLORE_DECAY
+        return ranked
+
+    def timeout(self, ip: str) -> float:
+        stats = self._get(ip)
+        if not stats.samples:
+            return MAX_TIMEOUT
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, TIMEOUT_FACTOR * stats.srtt))
+
+    def record_rtt(self, ip: str, rtt: float):
+        stats = self._get(ip)
+        if stats.samples:
+            stats.srtt = (1 - SRTT_WEIGHT) * stats.srtt + SRTT_WEIGHT * rtt
+        else:
+            stats.srtt = rtt
+        stats.samples += 1
+        stats.failures = 0
+
+    def record_failure(self, ip: str, timeout: float):
+        # back off exponentially: the server drops down the ranking until it answers again
+        stats = self._get(ip)
+        stats.failures += 1
+        stats.srtt = min(MAX_SRTT, max(stats.srtt * 2, timeout))
+
+    def snapshot(self) -> dict:
+        """ip -> {"srtt", "samples", "failures"} for every server seen so far."""
+        return {
+            ip: {"srtt": s.srtt, "samples": s.samples, "failures": s.failures}
+            for ip, s in self._stats.items()
+        }
@@ -0,0 +1,309 @@
+# transport.py
+import asyncio
+import random
+import struct
+import weakref
+
+
+DNS_PORT = 53
+POOL_SIZE = 4  # source ports shared by all in-flight queries
+
+TCP_POOL_SIZE = 2        # persistent TCP connections kept per server
+TCP_IDLE_TIMEOUT = 30.0  # seconds an unused TCP connection stays open
+
+_U16 = struct.Struct(">H")
+
+
+def read_question(data) -> tuple[str, int] | None:
+    """
+    Return (qname, qtype) from the question section of a DNS message, or None
+    if the packet is too short or the name is not a plain label sequence.
+    """
+    offset = 12
+    labels = []
+    try:
+        while True:
+            length = data[offset]
+            if length == 0:
+                offset += 1
+                break
+            if length & 0xC0:
+                return None  # questions are never compressed
+            labels.append(bytes(data[offset + 1:offset + 1 + length]).decode("ascii").lower())
+            offset += 1 + length
+        qtype = int.from_bytes(data[offset:offset + 2], "big")
+    except (IndexError, UnicodeDecodeError):
+        return None
+    if offset + 2 > len(data):
+        return None
+    return ".".join(labels), qtype
+
+
+class Transaction:
+    """One outstanding query, waiting for the reply that matches it."""
+
+    __slots__ = ("msg_id", "server", "qname", "qtype", "future")
+
+    def __init__(self, msg_id, server, qname, qtype, future):
+        self.msg_id = msg_id
+        self.server = server
+        self.qname = qname
+        self.qtype = qtype
+        self.future = future
+
+
+class _PoolSocket(asyncio.DatagramProtocol):
+    def __init__(self, mux, index):
+        self.mux = mux
+        self.index = index
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.mux._dispatch(self.index, data, addr)
+
+    def error_received(self, exc):
+        # ICMP errors on an unconnected socket can't be tied to a transaction,
+        # the waiter will time out instead.
+        pass
+
+
+class QueryMultiplexer:
+    """
+    Shares a small pool of UDP sockets between every in-flight query.
+
+    Each query gets a message ID that is unique for its (socket, server) pair,
+    and a reply is only handed to the waiter whose ID, server address, source
+    port and question all match. Anything else (late answers from a server we
+    already gave up on, spoofed or stray packets) is dropped.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self.pool_size = pool_size
+        self.pending: dict[tuple, Transaction] = {}
+        self.dropped = 0
+        self._sockets: list[_PoolSocket] = []
+        self._opening = None
+
+    async def _ensure_open(self):
+        if self._sockets:
+            return
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open())
+        try:
+            await asyncio.shield(self._opening)
+        except Exception:
+            self._opening = None
+            raise
+
+    async def _open(self):
+        loop = asyncio.get_running_loop()
+        sockets = []
+        for index in range(self.pool_size):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda index=index: _PoolSocket(self, index), local_addr=("0.0.0.0", 0)
+            )
+            sockets.append(protocol)
+        self._sockets = sockets
+
+    def _new_id(self, index: int, server: tuple) -> int:
+        while True:
+            msg_id = random.getrandbits(16)
+            if (index, msg_id, server) not in self.pending:
+                return msg_id
+
+    async def query(self, server_ip: str, packet: bytes, timeout: float, port: int = DNS_PORT):
+        """Send packet to server_ip and wait for its matching reply, returns (data, addr)."""
+        await self._ensure_open()
+        question = read_question(packet)
+        if question is None:
+            raise ValueError("query packet has no valid question section")
+        qname, qtype = question
+
+        server = (server_ip, port)
+        index = random.randrange(len(self._sockets))
+        msg_id = self._new_id(index, server)
+        key = (index, msg_id, server)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = Transaction(msg_id, server, qname, qtype, future)
+        try:
+            self._sockets[index].transport.sendto(msg_id.to_bytes(2, "big") + packet[2:], server)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(key, None)
+
+    def _dispatch(self, index: int, data: bytes, addr: tuple):
+        if len(data) < 12:
+            self.dropped += 1
+            return
+        msg_id = int.from_bytes(data[:2], "big")
+        txn = self.pending.get((index, msg_id, (addr[0], addr[1])))
+        if txn is None or txn.future.done() or read_question(data) != (txn.qname, txn.qtype):
+            self.dropped += 1
+            print(f"[-] dropped unmatched reply id={msg_id} from {addr[0]}")
+            return
+        txn.future.set_result((data, addr))
+
+    def close(self):
+        for sock in self._sockets:
+            sock.transport.close()
+        self._sockets = []
+        self._opening = None
+        for txn in self.pending.values():
+            if not txn.future.done():
+                txn.future.cancel()
+        self.pending.clear()
+
+
+class _TCPConnection:
+    """
+    One persistent TCP connection to a server carrying pipelined,
+    length-prefixed queries (RFC 7766). Replies may come back in any order
+    and are matched to their waiter by message ID and question.
+    """
+
+    def __init__(self, reader, writer, idle_timeout: float):
+        self.reader = reader
+        self.writer = writer
+        self.idle_timeout = idle_timeout
+        self.pending: dict[int, tuple] = {}  # msg_id -> (future, (qname, qtype))
+        self.closed = False
+        self.answered = 0
+        self._idle_handle = None
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        self._arm_idle_timer()
+
+    def _arm_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        self._idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self._close_if_idle)
+
+    def _close_if_idle(self):
+        if not self.pending:
+            self.close()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                (length,) = _U16.unpack(await self.reader.readexactly(2))
+                data = await self.reader.readexactly(length)
+                if len(data) < 12:
+                    continue
+                entry = self.pending.get(int.from_bytes(data[:2], "big"))
+                if entry is None or entry[0].done() or read_question(data) != entry[1]:
+                    continue
+                entry[0].set_result(data)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self.close()
+
+    async def query(self, packet: bytes, question: tuple, timeout: float) -> bytes:
+        while True:
+            msg_id = random.getrandbits(16)
+            if msg_id not in self.pending:
+                break
+        future = asyncio.get_running_loop().create_future()
+        self.pending[msg_id] = (future, question)
+        try:
+            data = msg_id.to_bytes(2, "big") + packet[2:]
+            self.writer.write(_U16.pack(len(data)) + data)
+            reply = await asyncio.wait_for(future, timeout)
+            self.answered += 1
+            return reply
+        finally:
+            self.pending.pop(msg_id, None)
+            if not self.pending and not self.closed:
+                self._arm_idle_timer()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        self._reader_task.cancel()
+        self.writer.close()
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("DNS TCP connection closed"))
+
+
+class TCPPool:
+    """
+    Up to size persistent TCP connections per server, shared by all
+    queries. A new connection is only opened when every existing one
+    already has queries in flight.
+    """
+
+    def __init__(self, size: int = TCP_POOL_SIZE, idle_timeout: float = TCP_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._connections: dict[tuple, list[_TCPConnection]] = {}
+        self._opening: dict[tuple, int] = {}
+
+    async def _acquire(self, server: tuple, timeout: float) -> _TCPConnection:
+        connections = [c for c in self._connections.get(server, []) if not c.closed]
+        self._connections[server] = connections
+        idle = [c for c in connections if not c.pending]
+        if idle:
+            return idle[0]
+        if connections and len(connections) + self._opening.get(server, 0) >= self.size:
+            return min(connections, key=lambda c: len(c.pending))
+
+        self._opening[server] = self._opening.get(server, 0) + 1
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(*server), timeout)
+        finally:
+            self._opening[server] -= 1
+        connection = _TCPConnection(reader, writer, self.idle_timeout)
+        self._connections.setdefault(server, []).append(connection)
+        return connection
+
+    async def query(self, server_ip: str, packet: bytes, timeout: float, port: int = DNS_PORT):
+        """Send packet over a pooled TCP connection, returns (data, addr)."""
+        question = read_question(packet)
+        if question is None:
+            raise ValueError("query packet has no valid question section")
+        server = (server_ip, port)
+        connection = await self._acquire(server, timeout)
+        reused = connection.answered > 0
+        try:
+            data = await connection.query(packet, question, timeout)
+        except ConnectionError:
+            if not reused:
+                raise
+            # the server may have closed a reused idle connection, retry once on a fresh one
+            connection = await self._acquire(server, timeout)
+            data = await connection.query(packet, question, timeout)
+        return data, server
+
+    def close(self):
+        for connections in self._connections.values():
+            for connection in connections:
+                connection.close()
+        self._connections.clear()
+
+
+# one multiplexer and TCP pool per event loop; resolver() runs each lookup on a
+# fresh loop and closes both before that loop ends
+_multiplexers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, QueryMultiplexer]" = weakref.WeakKeyDictionary()
+_tcp_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TCPPool]" = weakref.WeakKeyDictionary()
+
+
+def get_multiplexer() -> QueryMultiplexer:
+    loop = asyncio.get_running_loop()
+    mux = _multiplexers.get(loop)
+    if mux is None:
+        mux = _multiplexers[loop] = QueryMultiplexer()
+    return mux
+
+
+def get_tcp_pool() -> TCPPool:
+    loop = asyncio.get_running_loop()
+    pool = _tcp_pools.get(loop)
+    if pool is None:
+        pool = _tcp_pools[loop] = TCPPool()
+    return pool
@@ -0,0 +1,328 @@
+# wire.py
+import socket
+import struct
+
+
+TYPE_A = 1
+TYPE_NS = 2
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_MX = 15
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_OPT = 41
+
+TYPE_NAMES = {
+    TYPE_A: "A", TYPE_NS: "NS", TYPE_CNAME: "CNAME", TYPE_SOA: "SOA",
+    TYPE_MX: "MX", TYPE_TXT: "TXT", TYPE_AAAA: "AAAA", TYPE_OPT: "OPT",
+}
+TYPE_CODES = {name: code for code, name in TYPE_NAMES.items()}
+
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+
+MAX_NAME_LENGTH = 255
+EDNS_UDP_SIZE = 1232  # DNS flag day 2020 default, avoids IP fragmentation
+
+_HEADER = struct.Struct(">HHHHHH")
+_QUESTION = struct.Struct(">HH")
+_RR = struct.Struct(">HHIH")
+_U16 = struct.Struct(">H")
+_SOA = struct.Struct(">IIIII")
+
+
+class ParseError(ValueError):
+    """Raised for messages that are truncated or structurally invalid."""
+
+
+class Header:
+    __slots__ = ("id", "flags", "qdcount", "ancount", "nscount", "arcount")
+
+    def __init__(self, id, flags, qdcount, ancount, nscount, arcount):
+        self.id = id
+        self.flags = flags
+        self.qdcount = qdcount
+        self.ancount = ancount
+        self.nscount = nscount
+        self.arcount = arcount
+
+    @property
+    def rcode(self) -> int:
+        return self.flags & 0x000F
+
+    @property
+    def tc(self) -> bool:
+        return bool(self.flags & 0x0200)
+
+    @property
+    def aa(self) -> bool:
+        return bool(self.flags & 0x0400)
+
+
+class Question:
+    """wire is the name exactly as it was sent, or None if it was compressed."""
+
+    __slots__ = ("name", "qtype", "qclass", "wire")
+
+    def __init__(self, name, qtype, qclass, wire=None):
+        self.name = name
+        self.qtype = qtype
+        self.qclass = qclass
+        self.wire = wire
+
+
+class Record:
+    """
+    One resource record. data is decoded per type:
+    A/AAAA -> address str, NS/CNAME -> name str, TXT -> joined str,
+    MX -> (preference, exchange), SOA -> (mname, rname, serial, refresh,
+    retry, expire, minimum), anything else -> raw rdata bytes.
+    """
+
+    __slots__ = ("name", "rtype", "rclass", "ttl", "data")
+
+    def __init__(self, name, rtype, rclass, ttl, data):
+        self.name = name
+        self.rtype = rtype
+        self.rclass = rclass
+        self.ttl = ttl
+        self.data = data
+
+    def __repr__(self):
+        return f"Record({self.name!r}, {TYPE_NAMES.get(self.rtype, self.rtype)}, ttl={self.ttl}, {self.data!r})"
+
+
+class Message:
+    __slots__ = ("header", "questions", "answers", "authority", "additional")
+
+    def __init__(self, header, questions, answers, authority, additional):
+        self.header = header
+        self.questions = questions
+        self.answers = answers
+        self.authority = authority
+        self.additional = additional
+
+
+def read_name(buf, offset: int, names: dict) -> tuple[str, int]:
+    """
+    Decode a possibly compressed name at offset, returns (name, end offset).
+
+    Every compression pointer has to point before the label run it was found
+    in, so a malicious loop of pointers cannot recurse forever. names memoises
+    decoded suffixes by offset for the whole message, so a pointer to a name
+    that was already read costs one dict lookup.
+    """
+    labels = []
+    run = []         # (offset, label index) of labels in the current in-place run
+    pending = []     # finished runs: (their labels, in-place end offset)
+    suffix = None
+    limit = offset
+    pos = offset
+    length_left = MAX_NAME_LENGTH
+    size = len(buf)
+
+    while True:
+        hit = names.get(pos)
+        if hit is not None:
+            suffix = hit[0]
+            pending.append((run, hit[1]))
+            break
+        if pos >= size:
+            raise ParseError("name runs past the end of the message")
+        length = buf[pos]
+        if length >= 0xC0:
+            if pos + 1 >= size:
+                raise ParseError("truncated compression pointer")
+            target = ((length & 0x3F) << 8) | buf[pos + 1]
+            if target >= limit:
+                raise ParseError("compression pointer does not point backwards")
+            pending.append((run, pos + 2))
+            run = []
+            limit = pos = target
+            continue
+        if length & 0xC0:
+            raise ParseError("unsupported label type")
+        if length == 0:
+            pending.append((run, pos + 1))
+            break
+        length_left -= length + 1
+        if length_left < 0 or pos + 1 + length > size:
+            raise ParseError("name too long or truncated")
+        run.append((pos, len(labels)))
+        labels.append(str(buf[pos + 1:pos + 1 + length], "ascii", "replace"))
+        pos += 1 + length
+
+    tail = [suffix] if suffix else []
+    for starts, end in pending:
+        for start, index in starts:
+            names[start] = (".".join(labels[index:] + tail), end)
+    name = ".".join(labels + tail)
+    return name, pending[0][1]
+
+
+def _plain_name(raw: bytes) -> bytes | None:
+    """raw if it is one uncompressed name and nothing else, else None."""
+    pos = 0
+    while pos < len(raw):
+        length = raw[pos]
+        if length == 0:
+            return raw if pos == len(raw) - 1 else None
+        if length & 0xC0:
+            return None
+        pos += 1 + length
+    return None
+
+
+def _read_rdata(buf, rtype: int, offset: int, rdlen: int, names: dict):
+    end = offset + rdlen
+    if rtype == TYPE_A and rdlen == 4:
+        return socket.inet_ntop(socket.AF_INET, buf[offset:end])
+    if rtype == TYPE_AAAA and rdlen == 16:
+        return socket.inet_ntop(socket.AF_INET6, buf[offset:end])
+    if rtype in (TYPE_NS, TYPE_CNAME):
+        return read_name(buf, offset, names)[0]
+    if rtype == TYPE_MX and rdlen >= 3:
+        return _U16.unpack_from(buf, offset)[0], read_name(buf, offset + 2, names)[0]
+    if rtype == TYPE_TXT:
+        parts = []
+        pos = offset
+        while pos < end:
+            length = buf[pos]
+            if pos + 1 + length > end:
+                raise ParseError("TXT string overruns rdata")
+            parts.append(str(buf[pos + 1:pos + 1 + length], "utf-8", "replace"))
+            pos += 1 + length
+        return "".join(parts)
+    if rtype == TYPE_SOA:
+        mname, pos = read_name(buf, offset, names)
+        rname, pos = read_name(buf, pos, names)
+        if pos + _SOA.size > end:
+            raise ParseError("SOA rdata too short")
+        return (mname, rname) + _SOA.unpack_from(buf, pos)
+    return bytes(buf[offset:end])
+
+
+def _read_records(buf, offset: int, count: int, names: dict, out: list) -> int:
+    size = len(buf)
+    for _ in range(count):
+        name, offset = read_name(buf, offset, names)
+        if offset + 10 > size:
+            raise ParseError("record header truncated")
+        rtype, rclass, ttl, rdlen = _RR.unpack_from(buf, offset)
+        offset += 10
+        if offset + rdlen > size:
+            raise ParseError("rdata truncated")
+        if ttl & 0x80000000:
+            ttl = 0  # RFC 2181 section 8
+        out.append(Record(name, rtype, rclass, ttl, _read_rdata(buf, rtype, offset, rdlen, names)))
+        offset += rdlen
+    return offset
+
+
+def encode_name(name: str) -> bytes:
+    """Uncompressed wire form of a dotted name ("" or "." is the root)."""
+    out = []
+    for label in name.strip(".").split(".") if name.strip(".") else ():
+        data = label.encode("ascii")
+        if not 0 < len(data) <= 63:
+            raise ValueError(f"bad label in {name!r}")
+        out.append(bytes([len(data)]) + data)
+    out.append(b"\x00")
+    wire = b"".join(out)
+    if len(wire) > MAX_NAME_LENGTH:
+        raise ValueError(f"name too long: {name!r}")
+    return wire
+
+
+def encode_rdata(rtype: int, value: str) -> bytes:
+    """
+    Wire rdata from the text form the cache stores (see Record for the
+    decoded forms): "pref host" for MX, space separated fields for SOA.
+    """
+    if rtype == TYPE_A:
+        return socket.inet_pton(socket.AF_INET, value)
+    if rtype == TYPE_AAAA:
+        return socket.inet_pton(socket.AF_INET6, value)
+    if rtype in (TYPE_NS, TYPE_CNAME):
+        return encode_name(value)
+    if rtype == TYPE_MX:
+        preference, exchange = value.split(None, 1)
+        return _U16.pack(int(preference)) + encode_name(exchange)
+    if rtype == TYPE_TXT:
+        data = value.encode("utf-8")
+        chunks = [data[i:i + 255] for i in range(0, len(data), 255)] or [b""]
+        return b"".join(bytes([len(chunk)]) + chunk for chunk in chunks)
+    if rtype == TYPE_SOA:
+        mname, rname, *numbers = value.split()
+        return encode_name(mname) + encode_name(rname) + _SOA.pack(*map(int, numbers))
+    raise ValueError(f"cannot encode type {rtype}")
+
+
+def build_reply(query: Message, rcode: int = 0, answers=(), max_size: int | None = None,
+                edns: bool = False, flags: int = 0x8080, authority=()) -> bytes:
+    """
+    Response to a parsed query. answers and authority are iterables of (name,
+    rtype, ttl, value) with value in cached text form. flags defaults to QR + RA, RD is
+    copied from the query. Owners equal to the question name are written as a
+    pointer to it. edns adds an OPT record advertising EDNS_UDP_SIZE. A reply
+    longer than max_size is cut down to header and question with TC set.
+
+    The question name is copied from the query when it was sent uncompressed,
+    so names with labels we cannot write back as ASCII are echoed unchanged.
+    """
+    question = query.questions[0]
+    qname = question.wire or encode_name(question.name)
+    flags |= (query.header.flags & 0x0100) | (rcode & 0x000F)
+
+    sections = []
+    for section in (answers, authority):
+        records = []
+        for name, rtype, ttl, value in section:
+            owner = b"\xc0\x0c" if name.lower().strip(".") == question.name.lower().strip(".") else encode_name(name)
+            rdata = encode_rdata(rtype, value)
+            records.append(owner + _RR.pack(rtype, question.qclass, max(0, int(ttl)), len(rdata)) + rdata)
+        sections.append(records)
+    answer_rrs, authority_rrs = sections
+
+    opt = b"\x00" + _RR.pack(TYPE_OPT, EDNS_UDP_SIZE, 0, 0) if edns else b""
+    body = qname + _QUESTION.pack(question.qtype, question.qclass)
+    reply = (_HEADER.pack(query.header.id, flags, 1, len(answer_rrs), len(authority_rrs), 1 if opt else 0)
+             + body + b"".join(answer_rrs) + b"".join(authority_rrs) + opt)
+    if max_size is not None and len(reply) > max_size:
+        reply = _HEADER.pack(query.header.id, flags | 0x0200, 1, 0, 0, 1 if opt else 0) + body + opt
+    return reply
+
+
+def parse_message(data) -> Message:
+    """
+    Decode header, questions and all three record sections in one pass over
+    a memoryview of data. A reply with the TC bit set is returned with
+    whatever records fit before the cut instead of raising.
+    """
+    buf = memoryview(data)
+    if len(buf) < _HEADER.size:
+        raise ParseError("message shorter than a DNS header")
+    header = Header(*_HEADER.unpack_from(buf, 0))
+    names = {}
+    questions, answers, authority, additional = [], [], [], []
+
+    try:
+        offset = _HEADER.size
+        for _ in range(header.qdcount):
+            start = offset
+            name, offset = read_name(buf, offset, names)
+            if offset + 4 > len(buf):
+                raise ParseError("question truncated")
+            qtype, qclass = _QUESTION.unpack_from(buf, offset)
+            questions.append(Question(name, qtype, qclass, _plain_name(bytes(buf[start:offset]))))
+            offset += 4
+        offset = _read_records(buf, offset, header.ancount, names, answers)
+        offset = _read_records(buf, offset, header.nscount, names, authority)
+        _read_records(buf, offset, header.arcount, names, additional)
+    except ParseError:
+        if not header.tc:
+            raise
+    except (IndexError, struct.error) as e:
+        if not header.tc:
+            raise ParseError(str(e)) from e
+
+    return Message(header, questions, answers, authority, additional)
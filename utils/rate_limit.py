@@ -1,48 +1,239 @@
+import os
 import time
-from collections import defaultdict
-
-# --- Rate Limiting Variables ---
-user_last_request_times = defaultdict(list)  # Store last 3 request times
-user_daily_request_count = defaultdict(lambda: 0)
-last_daily_reset_time = time.time()
+import asyncio
+import struct
+import lmdb
+from collections import OrderedDict
+from pathlib import Path
+from dotenv import load_dotenv
 
 # --- Rate Limiting Constants ---
 REQUESTS_PER_MINUTE = 15
 REQUESTS_PER_DAY = 100
+MAX_TRACKED_KEYS = 10000   # least recently seen keys are dropped past this (in-memory store)
+FLUSH_INTERVAL = 5         # seconds between background flushes of the store
+SWEEP_INTERVAL = 300       # seconds between sweeps for idle keys
+SWEEP_BATCH = 512          # keys looked at per LMDB write transaction while sweeping
+
+load_dotenv()
+
+# RATE_LIMIT_BACKEND=lmdb keeps buckets in an LMDB environment shared by every
+# bot process on the host (and across restarts); the default keeps them in memory
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+LMDB_DIR = os.getenv("RATE_LIMIT_DIR") or str(PROJECT_ROOT / "global_cache" / "rate_limit")
+LMDB_MAP_SIZE = 10 * 1024 * 1024  # 10 MB, ~100k users
+
+# budget units a command uses up; anything not listed costs 1
+COMMAND_COSTS = {
+    "shodan": 5,     # paid API credits
+    "weather": 3,    # Gemini call with search
+    "dnsbatch": 3,   # up to 100 resolutions
+}
+
+
+class GCRA:
+    """
+    Generic cell rate algorithm: a token bucket kept as a single number,
+    the theoretical arrival time (TAT) of the next request. limit requests
+    per period refill continuously, so a full bucket is always at most one
+    period away and nothing needs a global reset.
+    """
+
+    __slots__ = ("limit", "period", "interval")
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.interval = period / limit  # time it takes to earn back one unit
+
+    def take(self, tat: float, cost: int, now: float) -> tuple[float, float]:
+        """(new TAT, 0) if cost units are available, else (old TAT, seconds until they are)."""
+        new_tat = max(tat, now) + min(cost, self.limit) * self.interval
+        wait = new_tat - now - self.period
+        if wait > 0:
+            return tat, wait
+        return new_tat, 0.0
+
+
+# A key whose TATs are all in the past has a full budget and is the same as an
+# unknown key, so stores may drop it at any time.
+
+class MemoryStore:
+    """
+    Per process TATs in LRU order: idle keys are dropped from the old end
+    as they are passed, and the oldest are dropped anyway past max_keys.
+    """
+
+    blocking = False  # sweep/flush are cheap and not thread safe, run them on the loop
+
+    def __init__(self, max_keys: int = MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.state: OrderedDict = OrderedDict()  # key -> [TAT per limit]
+
+    def update(self, key, charge, now: float):
+        result, tats = charge(self.state.get(key))
+        if tats is not None:
+            self.state[key] = tats
+            self.state.move_to_end(key)
+            self.sweep(now)
+        return result
+
+    def sweep(self, now: float):
+        while len(self.state) > self.max_keys:
+            self.state.popitem(last=False)
+        while self.state:
+            key, tats = next(iter(self.state.items()))
+            if max(tats) > now:
+                break
+            del self.state[key]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.state)
+
+
+class LMDBStore:
+    """
+    TATs in a shared LMDB environment, packed as big-endian doubles under
+    str(key). Every check is one write transaction, and LMDB allows a
+    single writer across all processes that open the environment, so the
+    read-modify-write is atomic between shards. The environment is opened
+    with sync=False: commits land in the OS page cache (visible to other
+    processes and safe from a process crash) and flush() makes them
+    durable in one fsync every FLUSH_INTERVAL instead of one per command.
+    """
+
+    blocking = True  # sweep/flush wait on disk and the writer lock, run them in a thread
 
+    def __init__(self, path: str = LMDB_DIR, map_size: int = LMDB_MAP_SIZE):
+        os.makedirs(path, exist_ok=True)
+        self.env = lmdb.open(path, map_size=map_size, subdir=True, max_dbs=1, lock=True,
+                             sync=False, readahead=False)
+        self.db = self.env.open_db(b"buckets")
 
-async def handle_rate_limit(ctx):
+    def update(self, key, charge, now: float):
+        raw_key = str(key).encode("utf-8")
+        with self.env.begin(write=True, db=self.db) as txn:
+            raw = txn.get(raw_key)
+            result, tats = charge(list(struct.unpack(f">{len(raw) // 8}d", raw)) if raw else None)
+            if tats is not None:
+                txn.put(raw_key, struct.pack(f">{len(tats)}d", *tats))
+        return result
+
+    def sweep(self, now: float, batch: int = SWEEP_BATCH):
+        # one short write transaction per batch, so other processes only ever
+        # wait for the writer lock as long as it takes to look at batch keys
+        start = None
+        while True:
+            with self.env.begin(write=True, db=self.db) as txn:
+                cursor = txn.cursor()
+                if not (cursor.set_range(start) if start else cursor.first()):
+                    return
+                idle, seen = [], 0
+                for key, raw in cursor:
+                    seen += 1
+                    if max(struct.unpack(f">{len(raw) // 8}d", raw)) <= now:
+                        idle.append(key)
+                    if seen == batch:
+                        start = key + b"\x00"  # smallest key after this one
+                        break
+                for key in idle:
+                    txn.delete(key)
+            if seen < batch:
+                return
+
+    def flush(self):
+        self.env.sync(True)
+
+    def close(self):
+        self.env.sync(True)
+        self.env.close()
+
+    def __len__(self):
+        with self.env.begin(db=self.db) as txn:
+            return txn.stat(self.db)["entries"]
+
+
+class RateLimiter:
+    """
+    Per key (user) budgets, one GCRA per named limit. Each key holds one
+    TAT per limit, so a check is O(1) whatever the request history.
+    """
+
+    def __init__(self, limits: dict, store=None):
+        self.limits = limits
+        self.store = store if store is not None else MemoryStore()
+        self.last_sweep = time.time()
+
+    def acquire(self, key, cost: int = 1, now: float | None = None) -> tuple[str | None, float]:
+        """
+        Charge cost to every limit of key. Returns (None, 0) if allowed,
+        else (name of the limit hit, seconds to wait) and charges nothing.
+        """
+        now = time.time() if now is None else now
+
+        def charge(tats):
+            if tats is None or len(tats) != len(self.limits):
+                tats = [0.0] * len(self.limits)
+            new_tats = []
+            for (name, gcra), tat in zip(self.limits.items(), tats):
+                new_tat, wait = gcra.take(tat, cost, now)
+                if wait:
+                    return (name, wait), None
+                new_tats.append(new_tat)
+            return (None, 0.0), new_tats
+
+        return self.store.update(key, charge, now)
+
+    async def maintain(self):
+        """Flush the store, and every SWEEP_INTERVAL drop idle keys; run every FLUSH_INTERVAL seconds."""
+        run = asyncio.to_thread if self.store.blocking else _call
+        now = time.time()
+        if now - self.last_sweep >= SWEEP_INTERVAL:
+            self.last_sweep = now
+            await run(self.store.sweep, now)
+        await run(self.store.flush)
+
+
+async def _call(fn, *args):
+    return fn(*args)
+
+
+def _open_store():
+    if BACKEND == "lmdb":
+        try:
+            store = LMDBStore()
+            print(f"[+] rate limits shared through LMDB at {LMDB_DIR}")
+            return store
+        except lmdb.Error as e:
+            print(f"[-] could not open rate limit LMDB ({e}), keeping limits in memory")
+    return MemoryStore()
+
+
+LIMITER = RateLimiter({
+    "minute": GCRA(REQUESTS_PER_MINUTE, 60),
+    "day": GCRA(REQUESTS_PER_DAY, 86400),
+}, _open_store())
+
+
+async def handle_rate_limit(ctx, cost: int | None = None):
     """A helper function to check and enforce rate limits for a user."""
-    global last_daily_reset_time
-    user_id = ctx.author.id
-    current_time = time.time()
-
-    # Reset daily counts if 24 hours have passed
-    if current_time - last_daily_reset_time > 86400:
-        user_daily_request_count.clear()
-        user_last_request_times.clear()
-        last_daily_reset_time = current_time
-        print("Daily rate limits have been reset for all users.")
-
-    # Remove request times older than 60 seconds
-    user_last_request_times[user_id] = [
-        req_time for req_time in user_last_request_times[user_id]
-        if current_time - req_time < 60
-    ]
-
-    # Check per-minute limit (3 requests per minute)
-    if len(user_last_request_times[user_id]) >= REQUESTS_PER_MINUTE:
-        oldest_request = user_last_request_times[user_id][0]
-        wait_time = int(60 - (current_time - oldest_request))
-        await ctx.send(f"Please wait {wait_time} more seconds before your next request.")
-        return False
+    if cost is None:
+        cost = COMMAND_COSTS.get(getattr(ctx.command, "name", None), 1)
 
-    # Check daily limit
-    if user_daily_request_count[user_id] >= REQUESTS_PER_DAY:
-        await ctx.send(f"You have reached your daily limit of {REQUESTS_PER_DAY} requests. Please try again tomorrow.")
+    limit, wait = LIMITER.acquire(ctx.author.id, cost)
+    if limit == "minute":
+        await ctx.send(f"Please wait {int(wait) + 1} more seconds before your next request.")
+        return False
+    if limit == "day":
+        hours, minutes = divmod(int(wait // 60) + 1, 60)
+        await ctx.send(f"You have reached your daily limit of {REQUESTS_PER_DAY} requests. "
+                       f"Please try again in {hours}h {minutes}m.")
         return False
-
-    # If all checks pass, update user data and allow the command
-    user_last_request_times[user_id].append(current_time)
-    user_daily_request_count[user_id] += 1
     return True